@@ -0,0 +1,201 @@
+"""
+Time each stage of bill generation on synthetic workbooks of growing size.
+
+Usage:
+    python benchmarks/bench_bill_stages.py [--items 100 1000 10000 50000] [--repeat N]
+        [--skip STAGE ...] [--output results.json] [--compare baseline.json]
+
+Stages: read (read_bill_sheets), process_bill, render (templates to HTML),
+pdf (generate_pdf per sheet), merge (merge_pdfs), optimize (optimize_pdf),
+docx (create_word_doc) and zip. Each is timed on its own, best of N runs. Workbooks are generated with
+synthetic_bill.py into a cache directory and reused across runs.
+
+Results are written as JSON: run metadata plus one record per item count and
+stage. --compare prints the ratio of each stage against an earlier results
+file. The PDF render cache is disabled unless BILL_PDF_CACHE_MB is set.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("BILL_PDF_CACHE_MB", "0")
+
+from streamlit_app import (  # noqa: E402
+    BILL_SHEET_LAYOUT,
+    EXCEL_ENGINE,
+    build_sheet_data,
+    build_user_inputs,
+    create_word_doc,
+    generate_pdf,
+    merge_pdfs,
+    optimize_pdf,
+    process_bill,
+    read_bill_sheets,
+    render_sheet_html
+)
+from synthetic_bill import write_workbook  # noqa: E402
+
+STAGES = ["read", "process_bill", "render", "pdf", "merge", "optimize", "docx", "zip"]
+WORKBOOK_DIR = os.path.join(tempfile.gettempdir(), "bill_bench_workbooks")
+BENCH_FIELDS = {
+    "start_date": "18-01-2025",
+    "completion_date": "17-04-2025",
+    "actual_completion_date": "01-03-2025",
+    "work_order_amount": 854678.0,
+    "premium_percent": 5.0,
+    "premium_type": "Above",
+    "agreement_no": "48/2024-25",
+    "contractor_name": "M/s Synthetic Electricals",
+    "work_description": "Synthetic repair and maintenance work for benchmarking"
+}
+
+
+def best_of(repeat, func, *args):
+    """Run func `repeat` times and return (best seconds, last result)."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def synthetic_workbook(n_items, seed):
+    path = os.path.join(WORKBOOK_DIR, f"synthetic_{n_items}_{seed}.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(WORKBOOK_DIR, exist_ok=True)
+        write_workbook(path, n_items, seed)
+    return path
+
+
+def run_stages(path, user_inputs, repeat, skip):
+    """Time the pipeline stages on one workbook. Returns {stage: seconds}."""
+    timings = {}
+
+    elapsed, sheets = best_of(repeat, read_bill_sheets, path)
+    timings["read"] = elapsed
+
+    def run_process_bill():
+        return process_bill(
+            *sheets,
+            user_inputs["premium_percent"],
+            user_inputs["premium_type"],
+            user_inputs["amount_paid_last_bill"],
+            user_inputs["is_first_bill"],
+            user_inputs
+        )
+    elapsed, (data, deviation_data, header_data) = best_of(repeat, run_process_bill)
+    timings["process_bill"] = elapsed
+    sheet_data = build_sheet_data(data, deviation_data, header_data, user_inputs)
+
+    if "render" not in skip:
+        timings["render"], _ = best_of(repeat, lambda: [
+            render_sheet_html(sheet_name, sheet_data[sheet_name]) for sheet_name, _ in BILL_SHEET_LAYOUT
+        ])
+
+    if "pdf" not in skip:
+        timings["pdf"], pdfs = best_of(repeat, lambda: [
+            generate_pdf(sheet_name, sheet_data[sheet_name], orientation)
+            for sheet_name, orientation in BILL_SHEET_LAYOUT
+        ])
+        if "merge" not in skip:
+            timings["merge"], merged_pdf = best_of(repeat, merge_pdfs, pdfs)
+            if "optimize" not in skip:
+                timings["optimize"], (merged_pdf, _, _) = best_of(repeat, optimize_pdf, merged_pdf)
+    else:
+        merged_pdf = b""
+
+    def build_docx():
+        buffer = io.BytesIO()
+        create_word_doc(data, deviation_data, header_data, output_path=buffer)
+        return buffer.getvalue()
+    if "docx" not in skip:
+        timings["docx"], docx_bytes = best_of(repeat, build_docx)
+    else:
+        docx_bytes = b""
+
+    def build_zip():
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+            zipf.writestr("BILL_AND_DEVIATION.pdf", merged_pdf)
+            zipf.writestr("BILL_AND_DEVIATION.docx", docx_bytes)
+        return buffer.getvalue()
+    if "zip" not in skip:
+        timings["zip"], _ = best_of(repeat, build_zip)
+
+    return timings
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["items"], r["stage"]): r["seconds"] for r in json.load(f)["results"]}
+    print(f"\nagainst {baseline_path} (ratio < 1 is faster)")
+    print(f"{'items':>7} {'stage':<13} {'baseline':>9} {'now':>9} {'ratio':>7}")
+    for record in results:
+        before = baseline.get((record["items"], record["stage"]))
+        if before:
+            print(f"{record['items']:>7} {record['stage']:<13} {before:>9.4f} {record['seconds']:>9.4f} "
+                  f"{record['seconds'] / before:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 1000, 10000, 50000],
+                        help="item counts of the synthetic workbooks")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, best time is kept")
+    parser.add_argument("--skip", nargs="+", default=[], choices=STAGES[2:], help="stages to leave out")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_bill_stages.json", help="results file (JSON)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    user_inputs = build_user_inputs(BENCH_FIELDS)
+    results = []
+    print(f"{'items':>7} {'stage':<13} {'seconds':>9}")
+    for n_items in args.items:
+        path = synthetic_workbook(n_items, args.seed)
+        for stage, seconds in run_stages(path, user_inputs, args.repeat, set(args.skip)).items():
+            results.append({"items": n_items, "stage": stage, "seconds": round(seconds, 6)})
+            print(f"{n_items:>7} {stage:<13} {seconds:>9.4f}")
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "excel_engine": EXCEL_ENGINE,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compare the streaming bill reader with the full pandas.read_excel path.
+
+Usage:
+    python benchmarks/bench_excel_reader.py [--repeat N] [workbook ...]
+
+Defaults to the sample workbooks in test_files/. Each reader is timed on the
+best of N runs and its ingested items are checked against the pandas path.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit_app import BILL_SHEETS, ingest_workbook, read_bill_sheets  # noqa: E402
+
+
+def read_with_pandas(path):
+    """The reader main() used before: every sheet in full through openpyxl."""
+    with pd.ExcelFile(path) as xls:
+        return tuple(pd.read_excel(xls, sheet_name, header=None) for sheet_name in BILL_SHEETS)
+
+
+def available_engines():
+    engines = ["openpyxl"]
+    try:
+        import python_calamine  # noqa: F401
+        engines.append("calamine")
+    except ImportError:
+        pass
+    return engines
+
+
+def best_time(read, path, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sheets = read(path)
+        best = min(best, time.perf_counter() - start)
+    return best, sheets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("workbooks", nargs="*", help="xlsx files (default: test_files/*.xlsx)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per reader, best time is kept")
+    args = parser.parse_args()
+
+    workbooks = args.workbooks or sorted(glob.glob(os.path.join(ROOT, "test_files", "*.xlsx")))
+    readers = [("pandas.read_excel", read_with_pandas)]
+    for engine in available_engines():
+        readers.append((f"stream/{engine}", lambda path, engine=engine: read_bill_sheets(path, engine)))
+
+    print(f"{'workbook':<50} {'reader':<20} {'seconds':>9} {'speedup':>8} same items")
+    for path in workbooks:
+        baseline, sheets = best_time(read_with_pandas, path, args.repeat)
+        expected = repr(ingest_workbook(*sheets))
+        for name, read in readers:
+            elapsed, sheets = best_time(read, path, args.repeat)
+            same = repr(ingest_workbook(*sheets)) == expected
+            print(f"{os.path.basename(path)[:50]:<50} {name:<20} {elapsed:>9.4f} {baseline / elapsed:>7.2f}x {same}")
+
+
+if __name__ == "__main__":
+    main()
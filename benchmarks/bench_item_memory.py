@@ -0,0 +1,81 @@
+"""
+Measure the memory held by the bill item tables of process_bill.
+
+Usage:
+    python benchmarks/bench_item_memory.py [--items 1000 10000 50000] [--seed N]
+
+process_bill keeps the joined items in one column-oriented ItemTable and hands
+the First Page, Extra Items and Deviation Statement tables out as views of it.
+For each synthetic workbook this reports the bytes allocated while building
+those tables (traced with tracemalloc), next to the same tables rebuilt as the
+lists of per-item dicts the pipeline used before.
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit_app import build_user_inputs, process_bill, read_bill_sheets  # noqa: E402
+from synthetic_bill import write_workbook  # noqa: E402
+from bench_bill_stages import BENCH_FIELDS  # noqa: E402
+
+WORKBOOK_DIR = os.path.join(tempfile.gettempdir(), "bill_bench_workbooks")
+
+
+def traced(func):
+    """Run func under tracemalloc. Returns (result, bytes still allocated by it)."""
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, allocated
+
+
+def measure(path, user_inputs):
+    """Bytes held by the item tables as views and as lists of dicts."""
+    sheets = read_bill_sheets(path)
+
+    def run_process_bill():
+        data, deviation_data, _ = process_bill(
+            *sheets,
+            user_inputs["premium_percent"],
+            user_inputs["premium_type"],
+            user_inputs["amount_paid_last_bill"],
+            user_inputs["is_first_bill"],
+            user_inputs
+        )
+        return data["items"], data["extra_items"], deviation_data["items"]
+    tables, columnar = traced(run_process_bill)
+
+    _, dicts = traced(lambda: [table.to_records() for table in tables])
+    return len(tables[-1]), columnar, dicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="item counts of the synthetic workbooks")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    user_inputs = build_user_inputs(BENCH_FIELDS)
+    print(f"{'items':>7} {'rows':>7} {'columnar MB':>12} {'dicts MB':>9} {'ratio':>6}")
+    for n_items in args.items:
+        path = os.path.join(WORKBOOK_DIR, f"synthetic_{n_items}_{args.seed}.xlsx")
+        if not os.path.exists(path):
+            os.makedirs(WORKBOOK_DIR, exist_ok=True)
+            write_workbook(path, n_items, args.seed)
+        rows, columnar, dicts = measure(path, user_inputs)
+        print(f"{n_items:>7} {rows:>7} {columnar / 2 ** 20:>12.2f} {dicts / 2 ** 20:>9.2f} "
+              f"{dicts / columnar:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Measure how long the app takes to render its page for a new session.
+
+Usage:
+    python benchmarks/bench_startup.py [--reruns N]
+
+Runs streamlit_app.py under Streamlit's AppTest runtime in a fresh process,
+with streamlit already imported as it is in a running server. Reports the
+first script run (module import, page build), the median of the following
+reruns, and which of the heavy output libraries the page loaded.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import streamlit  # noqa: F401  (loaded by the server before any session starts)
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# `streamlit run` puts the script's directory on sys.path; AppTest does not
+sys.path.insert(0, ROOT)
+HEAVY_MODULES = ["pdfkit", "pypdf", "docx", "num2words", "jinja2"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=7, help="reruns after the first run")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    app = AppTest.from_file(os.path.join(ROOT, "streamlit_app.py"), default_timeout=60).run()
+    first_run = time.perf_counter() - start
+    if app.exception:
+        sys.exit(f"app raised: {app.exception}")
+
+    reruns = []
+    for _ in range(args.reruns):
+        start = time.perf_counter()
+        app.run()
+        reruns.append(time.perf_counter() - start)
+
+    print(f"first run      {first_run * 1000:8.1f} ms")
+    print(f"rerun (median) {statistics.median(reruns) * 1000:8.1f} ms")
+    print(f"loaded         {', '.join(m for m in HEAVY_MODULES if m in sys.modules) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+
+if __name__ == "__main__":
+    main()
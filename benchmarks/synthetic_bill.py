@@ -0,0 +1,120 @@
+"""
+Write synthetic bill workbooks in the layout of the samples in test_files/.
+
+Usage:
+    python benchmarks/synthetic_bill.py OUTPUT_DIR [--items 100 1000 ...] [--seed N]
+
+Work Order and Bill Quantity carry a header block, the column header on row 21
+and items from row 22 in columns A-G (Item, Description, Unit, Quantity, Rate,
+Amount, BSR), grouped like the BSR schedule: a numbered heading row followed by
+its sub-items. Extra Items has the slip header and one extra item per 20 items.
+The output is deterministic for a given item count and seed.
+"""
+import argparse
+import os
+import random
+
+from openpyxl import Workbook
+
+ITEM_HEADER = ["Item", "Description", "Unit", "Quantity", "Rate", "Amount", "BSR"]
+EXTRA_HEADER = ["S.No.", "Ref. BSR No.", "Particulars", "Qty.", "Unit", "Rate", "Amount", "Remarks"]
+UNITS = ["P. point", "Each", "Mtr.", "Sqm", "Cum", "Kg", "Job"]
+GROUP_DESCRIPTION = (
+    "Supplying and fixing of {n} with ISI marked material including making connections, "
+    "testing etc. as required, all as per pre approved by Engineer in charge."
+)
+BILL_HEADER = [
+    ["FOR CONTRACTORS & SUPPLIERS ONLY FOR PAYMENT FOR WORK OR SUPPLIES ACTUALLY MEASURED"],
+    ["WORK ORDER"],
+    ["Cash Book Voucher No.", None, None, None, "Date-"],
+    ["Name of Contractor or supplier : "],
+    [None, "M/s Synthetic Electricals"],
+    ["Name of Work ;- "],
+    [None, "Synthetic repair and maintenance work for benchmarking"],
+    ["Serial No. of this bill :", None, None, None, "First & Final Bill"],
+    ["No. and date of the last bill- ", None, None, None, "Not Applicable"],
+    ["Reference to work order or Agreement :", None, None, None, "1179 Dt. 09-01-2025"],
+    ["Agreement No.", None, None, None, "48/2024-25"],
+    ["WORK ORDER AMOUNT RS.", None, None, None, 854678],
+    ["TENDER PREMIUM %", None, None, None, 5, "%", "Above"]
+]
+ITEM_HEADER_ROW = 21
+SUB_ITEMS_PER_GROUP = 4
+
+
+def item_rows(n_items, rng, bill):
+    """Yield the item rows of a Work Order (bill=False) or Bill Quantity sheet."""
+    written = 0
+    group = 0
+    while written < n_items:
+        group += 1
+        yield [group, GROUP_DESCRIPTION.format(n=group), None, None, None, None, f"{group}.1"]
+        written += 1
+        for sub in range(1, SUB_ITEMS_PER_GROUP + 1):
+            if written >= n_items:
+                break
+            # The work order quantity depends only on the item, so both sheets agree on it
+            qty = random.Random(group * 100 + sub).randint(1, 200)
+            if bill:
+                qty = max(0, qty + rng.randint(-10, 10))
+            rate = (group * 37 + sub * 11) % 900 + 10
+            yield [
+                None,
+                f"Sub item {sub} of group {group}",
+                UNITS[(group + sub) % len(UNITS)],
+                qty,
+                rate,
+                round(qty * rate),
+                f"{group}.1.{sub}"
+            ]
+            written += 1
+
+
+def write_workbook(path, n_items, seed=0):
+    """Write a bill workbook with `n_items` item rows per sheet to `path`."""
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+
+    for sheet_name, bill in (("Work Order", False), ("Bill Quantity", True)):
+        ws = wb.create_sheet(sheet_name)
+        header = BILL_HEADER if bill else []
+        for row in header:
+            ws.append(row)
+        for _ in range(ITEM_HEADER_ROW - 1 - len(header)):
+            ws.append([])
+        ws.append(ITEM_HEADER)
+        for row in item_rows(n_items, rng, bill):
+            ws.append(row)
+
+    ws = wb.create_sheet("Extra Items")
+    ws.append([None, None, None, "EXTRA ITEM SLIP"])
+    ws.append(["Name of Work :- ", None, "Synthetic repair and maintenance work for benchmarking"])
+    ws.append(["Name of Contractor or supplier : ", None, None, "M/s Synthetic Electricals"])
+    ws.append(["Reference to work order or Agreement : ", None, None, "1179 Dt. 09-01-2025"])
+    ws.append([])
+    ws.append(EXTRA_HEADER)
+    for i in range(1, n_items // 20 + 1):
+        qty = rng.randint(1, 20)
+        rate = rng.randint(50, 5000)
+        ws.append([f"E-{i:02d}", None, f"Extra item {i}", qty, "Each", rate, qty * rate, None])
+
+    wb.save(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output_dir", help="directory for the generated workbooks")
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 1000, 10000, 50000],
+                        help="item counts, one workbook each")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for n_items in args.items:
+        path = write_workbook(os.path.join(args.output_dir, f"synthetic_{n_items}.xlsx"), n_items, args.seed)
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Headless batch generation of bill packages.
+
+Processes every workbook in a directory with the same pipeline as the
+Streamlit app and writes one zip per bill plus a summary report, with the
+warnings each bill raised and its count of invalid cells. Bills with invalid
+cells also get their validation report as <workbook>_validation.csv.
+
+Usage:
+    python bill_cli.py INPUT_DIR --fields fields.csv --output OUT_DIR [--workers N]
+
+The fields file holds the sidebar values for each workbook, as CSV with a
+"workbook" column or as JSON (a list of objects with a "workbook" key, or an
+object keyed by workbook file name). Other columns use the user_inputs names,
+e.g. bill_serial, start_date (dd-mm-yyyy), work_order_amount, premium_percent,
+premium_type, agreement_no. A row with workbook "*" supplies defaults for all
+workbooks.
+
+Bills with an agreement_no are recorded in the running-account store
+(BILL_STORE_PATH), so a later bill of the same agreement gets its "since last"
+quantities and amount_paid_last_bill from it. The bills of one agreement are
+generated one after another in a single worker, in bill order: by the first
+number or ordinal word in bill_serial ("2nd Running Bill", "Second Bill"),
+then those without one ("Final Bill"), each in workbook file-name order. Their Work Order items are kept
+in the work-order store (BILL_WORK_ORDER_DIR) and reused by later bills whose
+Work Order sheet is unchanged.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from streamlit_app import (
+    RENDER_MODE,
+    BillJob,
+    build_user_inputs,
+    generate_bill_package,
+    ingest_bill_workbook,
+    missing_mandatory_fields,
+    timed
+)
+
+NUMERIC_FIELDS = {"work_order_amount", "premium_percent", "amount_paid_last_bill"}
+BOOLEAN_FIELDS = {"is_first_bill"}
+ORDINALS = [
+    "first", "second", "third", "fourth", "fifth", "sixth", "seventh", "eighth", "ninth", "tenth",
+    "eleventh", "twelfth", "thirteenth", "fourteenth", "fifteenth", "sixteenth", "seventeenth",
+    "eighteenth", "nineteenth", "twentieth"
+]
+ORDINAL_PATTERN = re.compile(r"\b(\d+)|\b(" + "|".join(ORDINALS) + r")\b")
+
+
+def parse_field(name, value):
+    """Convert a fields-file value to the type the sidebar widget would give."""
+    if name in NUMERIC_FIELDS:
+        return float(value) if value not in (None, "") else 0.0
+    if name in BOOLEAN_FIELDS:
+        return value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "y")
+    return "" if value is None else str(value)
+
+
+def load_fields(path):
+    """Read the fields file into a dict of workbook file name to field values."""
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        if isinstance(entries, dict):
+            entries = [{"workbook": workbook, **fields} for workbook, fields in entries.items()]
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            entries = list(csv.DictReader(f))
+
+    fields_by_workbook = {}
+    for entry in entries:
+        workbook = os.path.basename(str(entry.pop("workbook", "")).strip())
+        if not workbook:
+            raise ValueError(f"{path}: every entry needs a workbook name")
+        fields_by_workbook[workbook] = {name: parse_field(name, value) for name, value in entry.items()}
+    return fields_by_workbook
+
+
+def bill_order(bill_serial):
+    """
+    Position of a bill within its agreement, from the first number or ordinal
+    word of its serial: "2nd Running Bill" and "Second Bill" are 2, "First &
+    Final Bill" is 1. Returns None when the serial has neither.
+    """
+    match = ORDINAL_PATTERN.search(str(bill_serial).lower())
+    if match is None:
+        return None
+    return int(match.group(1)) if match.group(1) else ORDINALS.index(match.group(2)) + 1
+
+
+def agreement_batches(workbooks):
+    """
+    Split (workbook_path, fields) pairs into batches to run in one worker
+    each: the bills of an agreement together in bill order, so each is
+    generated after the bill before it is recorded, and every bill without
+    an agreement_no on its own.
+    """
+    batches = []
+    by_agreement = {}
+    for workbook_path, fields in workbooks:
+        agreement_no = str(build_user_inputs(fields)["agreement_no"]).strip()
+        if not agreement_no:
+            batches.append([(workbook_path, fields)])
+        elif agreement_no in by_agreement:
+            by_agreement[agreement_no].append((workbook_path, fields))
+        else:
+            by_agreement[agreement_no] = [(workbook_path, fields)]
+            batches.append(by_agreement[agreement_no])
+
+    def order(workbook):
+        position = bill_order(build_user_inputs(workbook[1])["bill_serial"])
+        return (position is None, position or 0)
+    # sort() is stable: bills of the same position stay in file-name order
+    for batch in batches:
+        batch.sort(key=order)
+    return batches
+
+
+def process_batch(batch, output_dir, render_mode):
+    """Generate the bills of one agreement_batches batch in order, in a worker process."""
+    return [process_workbook(workbook_path, fields, output_dir, render_mode) for workbook_path, fields in batch]
+
+
+def build_bill(workbook_path, user_inputs, render_mode):
+    with timed("ingest"):
+        ingested = ingest_bill_workbook(workbook_path, str(user_inputs["agreement_no"]).strip())
+    return generate_bill_package(ingested, user_inputs, render_mode)
+
+
+def process_workbook(workbook_path, fields, output_dir, render_mode):
+    """
+    Generate the bill package of one workbook in a worker process. The bill
+    runs as a BillJob, which keeps the warnings and information the app
+    would show.
+    Returns:
+        Summary row with status, timing spans, messages, invalid cell count
+        and output or error. A bill with invalid cells also has its
+        validation report written next to the zip, as CSV.
+    """
+    result = {
+        "workbook": os.path.basename(workbook_path), "status": "ok", "seconds": 0.0, "output": "", "error": "",
+        "issues": 0, "messages": []
+    }
+    start = time.perf_counter()
+    try:
+        user_inputs = build_user_inputs(fields)
+        missing = missing_mandatory_fields(user_inputs)
+        if missing:
+            raise ValueError(f"Missing mandatory fields: {', '.join(missing)}")
+
+        job = BillJob(result["workbook"])
+        job.run(build_bill, workbook_path, user_inputs, render_mode)
+        result["messages"] = job.outside_messages()
+        result["spans"] = job.timings.spans if job.timings is not None else []
+        name = os.path.splitext(result["workbook"])[0]
+        if job.report is not None and job.report.total:
+            # The report the app shows; the messages refer to it
+            result["issues"] = job.report.total
+            result["validation_report"] = os.path.join(output_dir, f"{name}_validation.csv")
+            with open(result["validation_report"], "wb") as f:
+                f.write(job.report.to_csv())
+        if job.status == "done":
+            output_path = os.path.join(output_dir, f"{name}.zip")
+            with open(output_path, "wb") as f:
+                f.write(job.result)
+            result["output"] = output_path
+        else:
+            result["status"] = "failed"
+            result["error"] = f"{job.error_type.__name__}: {job.error}"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate bill packages for a directory of workbooks.")
+    parser.add_argument("input_dir", help="directory of .xlsx bill workbooks")
+    parser.add_argument("--fields", required=True, help="CSV or JSON file with the sidebar fields per workbook")
+    parser.add_argument("--output", required=True, help="directory for the output zips and summary.json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parallel bills (default: CPU count)")
+    parser.add_argument("--render-mode", choices=["per_sheet", "batched", "chunked"], default=RENDER_MODE,
+                        help="PDF rendering strategy (default: BILL_RENDER_MODE or per_sheet)")
+    args = parser.parse_args(argv)
+
+    workbooks = sorted(glob.glob(os.path.join(args.input_dir, "*.xlsx")))
+    if not workbooks:
+        parser.error(f"no .xlsx files in {args.input_dir}")
+    fields_by_workbook = load_fields(args.fields)
+    defaults = fields_by_workbook.get("*", {})
+    os.makedirs(args.output, exist_ok=True)
+
+    batches = agreement_batches([
+        (workbook_path, {**defaults, **fields_by_workbook.get(os.path.basename(workbook_path), {})})
+        for workbook_path in workbooks
+    ])
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(process_batch, batch, args.output, args.render_mode) for batch in batches]
+        results = []
+        for future in futures:
+            for result in future.result():
+                results.append(result)
+                print(f"{result['status']:<7} {result['seconds']:>8.2f}s  {result['workbook']}  {result['error']}".rstrip())
+                for message in result["messages"]:
+                    print(f"{'':<18}{message}")
+
+    failed = [result for result in results if result["status"] != "ok"]
+    summary = {
+        "workbooks": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        "workers": args.workers,
+        "render_mode": args.render_mode,
+        "results": results
+    }
+    summary_path = os.path.join(args.output, "summary.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"{summary['succeeded']}/{summary['workbooks']} bills generated in {summary['wall_seconds']}s, summary in {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+"""
+Local HTTP service that generates bill packages for other tools.
+
+Runs the same pipeline as the Streamlit app in a pool of long-lived worker
+processes. Each worker loads the output libraries, compiles the templates and
+builds the Word skeleton when it starts, so requests do not pay for them.
+BILL_CONVERTER_SLOTS bounds the wkhtmltopdf processes of each worker, so up
+to BILL_CONVERTER_SLOTS x --workers converters run at once.
+
+Usage:
+    python bill_service.py [--port 8765] [--workers N] [--max-requests N] [--max-mb 50]
+
+Endpoints (the service listens on 127.0.0.1 only):
+    POST /bills   Body: the .xlsx workbook. Query string: the sidebar fields,
+                  by their user_inputs names as in bill_cli.py's fields file,
+                  e.g. ?work_order_amount=854678&premium_percent=5&premium_type=Above
+                  Responds with the zip, streamed in chunks, with headers
+                  X-Bill-Seconds, X-Bill-Issues (invalid cells found) and
+                  X-Bill-Messages (JSON list of the run's messages). Errors are
+                  JSON {"error": ...}: 400 for missing fields or an invalid
+                  Content-Length, 411 without one, 413 for a body
+                  over --max-mb, 422 for a workbook the pipeline rejects
+                  (ValueError), 500 for any other failure and 503, with
+                  Retry-After, when --max-requests are in progress. Tracebacks
+                  are logged by the service, not sent.
+    GET /health   JSON with the worker and request counts.
+
+Example:
+    curl -f --data-binary @bill.xlsx -o bill.zip \\
+        "http://127.0.0.1:8765/bills?work_order_amount=854678&premium_percent=5&premium_type=Above"
+"""
+import argparse
+import io
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from bill_cli import parse_field
+from streamlit_app import (
+    PDF_BACKEND,
+    RENDER_MODE,
+    BillJob,
+    DirectPdfBackend,
+    build_user_inputs,
+    generate_bill_package,
+    get_pdfkit_config,
+    get_template_env,
+    ingest_bill_workbook,
+    log_event,
+    missing_mandatory_fields,
+    timed,
+    word_skeleton
+)
+
+HOST = "127.0.0.1"
+# Size of the pieces the zip is written in
+RESPONSE_CHUNK_BYTES = 64 * 1024
+# Largest X-Bill-Messages header; the last messages are dropped to fit
+MESSAGES_HEADER_BYTES = 4096
+
+
+def warm_worker():
+    """
+    Load and build, once per worker process, what every bill uses. The
+    builders are process resources, so the bills the worker runs later get
+    these same objects.
+    """
+    import num2words  # noqa: F401
+    import pypdf  # noqa: F401
+    get_template_env()
+    word_skeleton()
+    if PDF_BACKEND == "direct":
+        DirectPdfBackend.drawing()
+    try:
+        get_pdfkit_config()
+    except OSError:
+        # No wkhtmltopdf: left to fail on the first render, with its error
+        pass
+
+
+def build_bill(file_bytes, user_inputs, render_mode):
+    with timed("ingest"):
+        ingested = ingest_bill_workbook(io.BytesIO(file_bytes), str(user_inputs["agreement_no"]).strip())
+    return generate_bill_package(ingested, user_inputs, render_mode)
+
+
+def generate_bill(file_bytes, fields, render_mode):
+    """
+    Generate the bill package of one uploaded workbook in a worker process.
+    Returns:
+        Dict with status ("done", "invalid" for missing fields, "rejected"
+        for a workbook the pipeline rejects or "failed"), the zip, the error
+        and the run's messages, invalid cell count and timing spans. The
+        messages leave out the tracebacks ("write" messages), which are
+        logged here instead.
+    """
+    user_inputs = build_user_inputs(fields)
+    missing = missing_mandatory_fields(user_inputs)
+    if missing:
+        return {"status": "invalid", "error": f"Missing mandatory fields: {', '.join(missing)}"}
+
+    job = BillJob(fields.get("bill_serial") or "bill")
+    job.run(build_bill, file_bytes, user_inputs, render_mode)
+    status = job.status
+    if status == "failed" and issubclass(job.error_type, ValueError):
+        status = "rejected"
+    return {
+        "status": status,
+        "zip": job.result,
+        "error": job.error,
+        "messages": job.outside_messages(),
+        "issues": job.report.total if job.report is not None else 0,
+        "spans": job.timings.spans if job.timings is not None else []
+    }
+
+
+def messages_header(messages, limit=MESSAGES_HEADER_BYTES):
+    """
+    JSON list of a bill's messages for the X-Bill-Messages header, at most
+    `limit` bytes: past that the last messages are replaced by a count of
+    those left out.
+    """
+    kept = list(messages)
+    header = json.dumps(kept)
+    while len(header) > limit and kept:
+        kept.pop()
+        header = json.dumps(kept + [f"{len(messages) - len(kept)} more message(s) left out"])
+    return header
+
+
+class BillService:
+    """
+    The worker pool and request limits shared by the server's request
+    threads. At most `max_requests` bills are accepted at once, queued for
+    the `workers` processes; past that requests are turned away at once
+    rather than left waiting on a growing queue.
+    """
+
+    def __init__(self, workers, max_requests, max_bytes, render_mode=RENDER_MODE):
+        self.workers = max(1, workers)
+        self.max_requests = max(1, max_requests)
+        self.max_bytes = max_bytes
+        self.render_mode = render_mode
+        self.in_progress = 0
+        self.served = 0
+        self._slots = threading.BoundedSemaphore(self.max_requests)
+        self._lock = threading.Lock()
+        self._pool = self._start_pool()
+
+    def _start_pool(self):
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+        # Start every worker now, so the first requests find them warm
+        for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        return pool
+
+    def try_acquire(self):
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.in_progress += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_progress -= 1
+            self.served += 1
+        self._slots.release()
+
+    def generate(self, file_bytes, fields):
+        """Run generate_bill in a worker, starting a new pool if a worker died."""
+        pool = self._pool
+        try:
+            return pool.submit(generate_bill, file_bytes, fields, self.render_mode).result()
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = self._start_pool()
+            raise
+
+    def health(self):
+        with self._lock:
+            return {
+                "status": "ok",
+                "workers": self.workers,
+                "max_requests": self.max_requests,
+                "in_progress": self.in_progress,
+                "served": self.served,
+                "render_mode": self.render_mode
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+class BillRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "BillService/1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def send_json(self, status, body, headers=None):
+        """Send a JSON response with its length, so the connection can be reused."""
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def reject(self, status, error, length=0, headers=None):
+        """
+        Answer with a JSON error without handling the request, after
+        discarding the `length` bytes of body the client sends regardless.
+        """
+        while length > 0:
+            chunk = self.rfile.read(min(length, RESPONSE_CHUNK_BYTES))
+            if not chunk:
+                break
+            length -= len(chunk)
+        self.close_connection = True
+        self.send_json(status, {"error": error}, headers)
+
+    def send_zip(self, zip_bytes, headers):
+        """Send the zip with chunked transfer encoding, RESPONSE_CHUNK_BYTES at a time."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Disposition", 'attachment; filename="bill_output.zip"')
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        view = memoryview(zip_bytes)
+        for start in range(0, len(view), RESPONSE_CHUNK_BYTES):
+            chunk = view[start:start + RESPONSE_CHUNK_BYTES]
+            self.wfile.write(b"%x\r\n" % len(chunk))
+            self.wfile.write(chunk)
+            self.wfile.write(b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/health":
+            self.send_json(200, self.service.health())
+        else:
+            self.reject(404, "Not found")
+
+    def content_length(self):
+        """The request's Content-Length: None when missing, -1 when not a valid length."""
+        value = self.headers.get("Content-Length")
+        if value is None:
+            return None
+        try:
+            length = int(value)
+        except ValueError:
+            return -1
+        # A negative length would make rfile.read() wait for the connection to close
+        return length if length >= 0 else -1
+
+    def handle_expect_100(self):
+        # A client waiting for "100 Continue" is told before it sends an oversized workbook
+        length = self.content_length()
+        if length == -1:
+            self.reject(400, "Invalid Content-Length")
+            return False
+        if length is not None and length > self.service.max_bytes:
+            self.reject(413, f"Workbook over {self.service.max_bytes // (1024 * 1024)} MB")
+            return False
+        return super().handle_expect_100()
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = self.content_length()
+        if length is None:
+            self.reject(411, "Content-Length is required")
+            return
+        if length == -1:
+            self.reject(400, "Invalid Content-Length")
+            return
+        if url.path != "/bills":
+            self.reject(404, "Not found", length)
+            return
+        if length > self.service.max_bytes:
+            self.reject(413, f"Workbook over {self.service.max_bytes // (1024 * 1024)} MB", length)
+            return
+        try:
+            fields = {name: parse_field(name, value) for name, value in parse_qsl(url.query)}
+        except ValueError as e:
+            self.reject(400, f"Invalid field: {e}", length)
+            return
+        if not self.service.try_acquire():
+            self.reject(503, "Too many bills in progress", length, {"Retry-After": "1"})
+            return
+
+        start = time.perf_counter()
+        try:
+            file_bytes = self.rfile.read(length)
+            try:
+                result = self.service.generate(file_bytes, fields)
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    result = {"status": "failed", "error": "The bill worker stopped unexpectedly"}
+                else:
+                    result = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+                status = 500
+            else:
+                status = {"done": 200, "invalid": 400, "rejected": 422}.get(result["status"], 500)
+        finally:
+            self.service.release()
+        seconds = round(time.perf_counter() - start, 3)
+        log_event("service_request", status=status, seconds=seconds, bytes=length, error=result.get("error"))
+
+        if status != 200:
+            self.send_json(status, {"error": result["error"]})
+            return
+        self.send_zip(result["zip"], {
+            "X-Bill-Seconds": str(seconds),
+            "X-Bill-Issues": str(result["issues"]),
+            "X-Bill-Messages": messages_header(result["messages"])
+        })
+
+    def log_message(self, format, *args):
+        # Requests are logged as service_request events instead
+        pass
+
+
+def make_server(port, workers, max_requests, max_bytes, render_mode=RENDER_MODE):
+    """
+    Start the worker pool and bind the server to 127.0.0.1:`port` (0 picks a
+    free port). Call serve_forever() to handle requests, then
+    server.service.shutdown() after server.shutdown().
+    """
+    server = ThreadingHTTPServer((HOST, port), BillRequestHandler)
+    server.daemon_threads = True
+    server.service = BillService(workers, max_requests, max_bytes, render_mode)
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve bill generation over HTTP on localhost.")
+    parser.add_argument("--port", type=int, default=8765, help="port on 127.0.0.1 (default: 8765, 0 for any)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes generating bills (default: CPU count)")
+    parser.add_argument("--max-requests", type=int, help="bills accepted at once, running or queued (default: 2 x workers)")
+    parser.add_argument("--max-mb", type=float, default=50, help="largest workbook accepted, in MB (default: 50)")
+    parser.add_argument("--render-mode", choices=["per_sheet", "batched", "chunked"], default=RENDER_MODE,
+                        help="PDF rendering strategy (default: BILL_RENDER_MODE or per_sheet)")
+    args = parser.parse_args(argv)
+
+    server = make_server(
+        args.port,
+        args.workers,
+        args.max_requests or 2 * max(1, args.workers),
+        int(args.max_mb * 1024 * 1024),
+        args.render_mode
+    )
+    print(f"Serving bills on http://{HOST}:{server.server_port} with {server.service.workers} worker(s)", flush=True)
+    # Stop the workers on SIGTERM too, not only on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
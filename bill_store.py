@@ -0,0 +1,129 @@
+"""
+Running-account store: the up-to-date quantities and amounts of every bill.
+
+Each generated bill is recorded under its agreement number and bill serial,
+with one row per BSR code. The next bill of the agreement looks up the
+previous bill's rows to work out its "since last certificate" quantities and
+amounts, and the previous bill's payable amount as the amount already paid,
+without reading earlier workbooks again.
+
+Recording a bill again under the same serial replaces it, so regenerating a
+bill does not count it twice. The store is a local SQLite file; the
+streamlit_app.py pipeline uses it when BILL_STORE_PATH is not empty.
+"""
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bills (
+    id INTEGER PRIMARY KEY,
+    agreement_no TEXT NOT NULL,
+    bill_serial TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    payable REAL NOT NULL,
+    UNIQUE (agreement_no, bill_serial)
+);
+CREATE TABLE IF NOT EXISTS bill_items (
+    bill_id INTEGER NOT NULL REFERENCES bills (id) ON DELETE CASCADE,
+    bsr TEXT NOT NULL,
+    qty_upto_date REAL NOT NULL,
+    amount_upto_date REAL NOT NULL,
+    PRIMARY KEY (bill_id, bsr)
+) WITHOUT ROWID;
+"""
+
+# Upper bound for bill ids when looking up the bill before a new serial
+LAST_ID = 2 ** 63 - 1
+
+
+class RunningAccountStore:
+    """
+    SQLite store of recorded bills. A connection is opened per call, so one
+    store can be shared by the app's session threads and the CLI's worker
+    processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def previous_bill(self, agreement_no, bill_serial):
+        """
+        The bill recorded before `bill_serial` for the agreement: the latest
+        one when `bill_serial` is new, otherwise the one recorded just before
+        it.
+        Returns:
+            Dict with bill_serial, recorded_at, payable and items
+            ({bsr: (qty_upto_date, amount_upto_date)}), or None for the
+            agreement's first bill.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                """
+                SELECT id, bill_serial, recorded_at, payable FROM bills
+                WHERE agreement_no = ?
+                  AND id < COALESCE((SELECT id FROM bills WHERE agreement_no = ? AND bill_serial = ?), ?)
+                ORDER BY id DESC LIMIT 1
+                """,
+                (agreement_no, agreement_no, bill_serial, LAST_ID)
+            ).fetchone()
+            if row is None:
+                return None
+            bill_id, serial, recorded_at, payable = row
+            items = conn.execute(
+                "SELECT bsr, qty_upto_date, amount_upto_date FROM bill_items WHERE bill_id = ?", (bill_id,)
+            ).fetchall()
+        return {
+            "bill_serial": serial,
+            "recorded_at": recorded_at,
+            "payable": payable,
+            "items": {bsr: (qty, amount) for bsr, qty, amount in items}
+        }
+
+    def record_bill(self, agreement_no, bill_serial, items, payable):
+        """
+        Record a bill's up-to-date quantities and amounts, replacing any bill
+        recorded before under the same serial but keeping its place in the
+        agreement's sequence.
+        Args:
+            items: First Page item dicts with bsr, qty_upto_date and
+                amount_upto_date. Items without a BSR code are not recorded;
+                for a repeated code the first item is kept.
+            payable: Up-to-date payable amount of the bill.
+        Returns:
+            The bill's id in the store.
+        """
+        rows = {}
+        for item in items:
+            if item["bsr"]:
+                rows.setdefault(item["bsr"], (float(item["qty_upto_date"]), float(item["amount_upto_date"])))
+        recorded_at = datetime.now().isoformat(timespec="seconds")
+
+        with closing(self._connect()) as conn, conn:
+            bill_id = conn.execute(
+                """
+                INSERT INTO bills (agreement_no, bill_serial, recorded_at, payable)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (agreement_no, bill_serial) DO UPDATE SET
+                    recorded_at = excluded.recorded_at,
+                    payable = excluded.payable
+                RETURNING id
+                """,
+                (agreement_no, bill_serial, recorded_at, float(payable))
+            ).fetchone()[0]
+            conn.execute("DELETE FROM bill_items WHERE bill_id = ?", (bill_id,))
+            conn.executemany(
+                "INSERT INTO bill_items (bill_id, bsr, qty_upto_date, amount_upto_date) VALUES (?, ?, ?, ?)",
+                [(bill_id, bsr, qty, amount) for bsr, (qty, amount) in rows.items()]
+            )
+        return bill_id
@@ -0,0 +1,334 @@
+"""
+Direct PDF drawing of the bill's table sheets with fpdf2.
+
+The "direct" render backend in streamlit_app.py uses this module to draw the
+First Page, Last Page, Extra Items, Deviation Statement and Certificate III
+sheets from the same data dicts the HTML templates receive, without HTML
+layout or a wkhtmltopdf subprocess. Layout follows the templates: A4, Arial
+metrics (Helvetica), 8pt text, bordered tables with bold centred headings
+that repeat on every page.
+
+fpdf2 is an optional dependency. Its core fonts only cover Latin-1; set
+BILL_DIRECT_PDF_FONT to a TrueType font file to draw other scripts.
+"""
+import os
+
+from fpdf import FPDF
+from fpdf.fonts import FontFace
+
+# TrueType font used instead of the built-in Helvetica when set
+DIRECT_PDF_FONT = os.environ.get("BILL_DIRECT_PDF_FONT", "")
+
+MARGIN_MM = 10
+HEADING_FILL = (240, 240, 240)
+
+
+class BillPdf(FPDF):
+    """A4 page with the sheet's margins and font."""
+
+    def __init__(self, orientation):
+        super().__init__(orientation="L" if orientation == "landscape" else "P", unit="mm", format="A4")
+        self.set_margins(MARGIN_MM, MARGIN_MM, MARGIN_MM)
+        self.set_auto_page_break(True, margin=MARGIN_MM)
+        if DIRECT_PDF_FONT:
+            self.add_font("bill", "", DIRECT_PDF_FONT)
+            self.add_font("bill", "B", DIRECT_PDF_FONT)
+            self.bill_font = "bill"
+        else:
+            self.bill_font = "helvetica"
+        self.set_font(self.bill_font, size=8)
+        self.add_page()
+
+    def text_value(self, value):
+        """Cell text for a template value, as Jinja prints it."""
+        text = "" if value is None else str(value)
+        if not DIRECT_PDF_FONT:
+            # Core fonts are Latin-1 only
+            text = text.encode("latin-1", "replace").decode("latin-1")
+        return text
+
+    def heading(self, text, size=12):
+        self.set_font(self.bill_font, "B", size)
+        self.cell(0, 8, self.text_value(text), new_x="LMARGIN", new_y="NEXT")
+        self.set_font(self.bill_font, "", 8)
+
+    def paragraph(self, text, bold=False, align="L"):
+        self.set_font(self.bill_font, "B" if bold else "", 8)
+        self.multi_cell(0, 4, self.text_value(text), align=align, new_x="LMARGIN", new_y="NEXT")
+        self.set_font(self.bill_font, "", 8)
+
+    def grid(self, widths, headings, rows, font_size=8, heading_size=7):
+        """
+        Draw a bordered table scaled to the page width.
+        Args:
+            widths: Column widths in mm, as in the template; scaled to fit.
+            headings: Heading rows, repeated on every page.
+            rows: Body rows; a cell is a value or a (value, colspan) tuple.
+        """
+        scale = self.epw / sum(widths)
+        heading_style = FontFace(emphasis="BOLD", fill_color=HEADING_FILL, size_pt=heading_size)
+        self.set_font(self.bill_font, "", font_size)
+        with self.table(
+            width=self.epw,
+            col_widths=[width * scale for width in widths],
+            headings_style=heading_style,
+            num_heading_rows=len(headings),
+            repeat_headings=1,
+            line_height=font_size * 0.45,
+            padding=1,
+            text_align="LEFT"
+        ) as table:
+            for heading in headings:
+                row = table.row()
+                for value in heading:
+                    row.cell(self.text_value(value), align="CENTER")
+            for cells in rows:
+                row = table.row()
+                for cell in cells:
+                    value, colspan = cell if isinstance(cell, tuple) else (cell, 1)
+                    row.cell(self.text_value(value), colspan=colspan)
+        self.ln(4)
+
+
+def percent(fraction):
+    return "%.2f%%" % (fraction * 100) if fraction is not None else ""
+
+
+def draw_first_page(pdf, data):
+    pdf.heading("CONTRACTOR BILL")
+    pdf.paragraph(
+        "FOR CONTRACTORS & SUPPLIERS ONLY FOR PAYMENT FOR WORK OR SUPPLIES ACTUALLY MEASURED WORK ORDER",
+        bold=True,
+        align="C"
+    )
+    pdf.ln(2)
+    pdf.grid([15, 70, 115], [["Sl No.", "Particulars", "Details"]], [row[:3] for row in data["header"] if row])
+
+    totals = data["totals"]
+    premium_fraction = totals["premium"].get("percent", data.get("premium_percent"))
+    premium_amount = totals["premium"].get("amount", 0)
+    paid = data.get("amount_paid_last_bill", 0)
+    rows = []
+    for item in data["items"]:
+        has_unit = bool(str(item.get("unit", "")).strip())
+        has_rate = has_unit and bool(str(item.get("rate", "")).strip())
+        rows.append([
+            item.get("unit", ""),
+            item.get("qty_since_last") if has_unit else "",
+            item.get("qty_upto_date") if has_unit else "",
+            item.get("serial_no", ""),
+            item.get("description", ""),
+            item.get("rate", ""),
+            item.get("amount_upto_date") if has_rate else "",
+            item.get("amount_since_prev") if has_rate else "",
+            item.get("remark", "")
+        ])
+    blank = ("", 4)
+    rows += [
+        [blank, "Total", "", totals.get("grand_total", ""), "", ""],
+        [blank, f"Premium @ {percent(premium_fraction)}", percent(premium_fraction), premium_amount, "", ""],
+        [blank, "Grand Total", "", totals.get("grand_total", 0) + premium_amount, "", ""],
+        [blank, "Deduction (Amount Paid in Last Bill)", "", f"-{paid}", "", ""],
+        [blank, "Net Payable Amount", "", totals.get("grand_total", 0) + premium_amount - paid, "", ""]
+    ]
+    pdf.grid(
+        [10.92, 14.93, 14.93, 10.36, 68.47, 14.28, 17.94, 13.19, 12.98],
+        [
+            [
+                "Unit",
+                "Quantity executed (or supplied) since last certificate",
+                "Quantity executed (or supplied) upto date as per MB",
+                "S. No.",
+                'Item of Work supplies (Grouped under "sub-head" and "sub work" of estimate)',
+                "Rate",
+                "Upto date Amount",
+                "Amount Since previous bill (Total for each sub-head)",
+                "Remarks"
+            ],
+            [str(column) for column in range(1, 10)]
+        ],
+        rows
+    )
+
+
+def draw_last_page(pdf, data):
+    pdf.set_font(pdf.bill_font, "", 9)
+    pdf.ln(6)
+    for note in data.get("notes", []):
+        pdf.multi_cell(0, 5, pdf.text_value(note), new_x="LMARGIN", new_y="NEXT")
+        pdf.ln(3)
+
+
+def draw_extra_items(pdf, data):
+    pdf.heading("EXTRA ITEM SLIP")
+    for label, key in (("Name of Work", "name_of_work"), ("Bill Number", "bill_serial"), ("Agency Name", "name_of_firm")):
+        pdf.paragraph(f"{label}: {data.get(key, '')}")
+    pdf.ln(2)
+
+    rows = [
+        [
+            item.get("unit", ""),
+            item.get("qty_bill", ""),
+            item.get("qty_bill", ""),
+            item.get("serial_no", ""),
+            item.get("description", ""),
+            item.get("rate", ""),
+            item.get("amt_bill", ""),
+            item.get("amt_bill", ""),
+            item.get("remark", "")
+        ]
+        for item in data["items"]
+    ]
+    totals = data.get("totals")
+    if totals:
+        premium = totals["premium"]
+        blank = ("", 4)
+        rows += [
+            [blank, "Grand Total", "", totals["grand_total"], totals["grand_total"], ""],
+            [blank, f"Tender Premium @ {percent(premium['percent'])}", percent(premium["percent"]),
+             premium["amount"], premium["amount"], ""],
+            [blank, "Total including Tender Premium", "", totals["payable"], totals["payable"], ""]
+        ]
+    pdf.grid(
+        [10.06, 13.76, 13.76, 9.55, 63.83, 13.16, 19.53, 15.15, 11.96],
+        [[
+            "Unit",
+            "Quantity executed (or supplied) since last certificate",
+            "Quantity executed (or supplied) upto date as per MB",
+            "Item No.",
+            'Item of Work supplies (Grouped under "sub-head" and "sub work" of estimate)',
+            "Rate",
+            "Amount upto date",
+            "Amount Since previous bill (Total for each sub-head)",
+            "Remark"
+        ]],
+        rows
+    )
+
+
+def draw_deviation_statement(pdf, data):
+    pdf.heading("Deviation Statement")
+    header = data.get("header") or []
+    agreement_no = header[12][4] if len(header) > 12 and len(header[12]) > 4 else ""
+    name_of_work = header[8][1] if len(header) > 8 and len(header[8]) > 1 else ""
+    pdf.paragraph(f"Agreement No: {agreement_no}")
+    pdf.paragraph(f"Name of Work: {name_of_work}")
+    pdf.ln(2)
+
+    rows = []
+    for item in data["items"]:
+        has_unit = bool(str(item.get("unit", "")).strip())
+        has_rate = has_unit and bool(str(item.get("rate", "")).strip())
+        rows.append([
+            item.get("serial_no", ""),
+            item.get("description", ""),
+            item.get("unit", ""),
+            item.get("qty_wo") if has_unit else "",
+            item.get("rate") if has_unit else "",
+            item.get("amt_wo") if has_rate else "",
+            item.get("qty_bill") if has_unit else "",
+            item.get("amt_bill") if has_rate else "",
+            item.get("excess_qty") if has_unit else "",
+            item.get("excess_amt") if has_rate else "",
+            item.get("saving_qty") if has_unit else "",
+            item.get("saving_amt") if has_rate else "",
+            item.get("remark", "")
+        ])
+    if not rows:
+        rows.append([("No deviation items available", 13)])
+
+    summary = data.get("summary")
+    if summary:
+        premium_fraction = summary.get("premium", {}).get("percent", data.get("premium_percent"))
+        net_difference = summary.get("net_difference", "")
+        for label, keys in (
+            ("Grand Total Rs.", ["work_order_total", "executed_total", "overall_excess", "overall_saving"]),
+            (f"Add Tender Premium ({percent(premium_fraction)})",
+             ["tender_premium_f", "tender_premium_h", "tender_premium_j", "tender_premium_l"]),
+            ("Grand Total including Tender Premium Rs.", ["grand_total_f", "grand_total_h", "grand_total_j", "grand_total_l"])
+        ):
+            row = ["", label, "", "", ""]
+            for key in keys:
+                row += [summary.get(key, ""), ""]
+            rows.append(row)
+        net_label = (
+            "Overall Excess With Respect to the Work Order Amount Rs."
+            if net_difference != "" and net_difference > 0
+            else "Overall Saving With Respect to the Work Order Amount Rs."
+        )
+        rows.append(["", net_label, "", "", "", "", "", net_difference, "", "", "", "", ""])
+    else:
+        rows.append([("No summary data available", 13)])
+
+    pdf.grid(
+        [6.67, 120.0] + [6.67] * 10 + [15.0],
+        [[
+            "ITEM No.", "Description", "Unit", "Qty as per Work Order", "Rate", "Amt as per Work Order Rs.",
+            "Qty Executed", "Amt as per Executed Rs.", "Excess Qty", "Excess Amt Rs.", "Saving Qty",
+            "Saving Amt Rs.", "REMARKS/REASON."
+        ]],
+        rows,
+        font_size=7,
+        heading_size=6
+    )
+
+
+def draw_certificate_iii(pdf, data):
+    pdf.heading("III. MEMORANDUM OF PAYMENTS", size=10)
+    recoveries = {item.get("description"): item.get("amount", "") for item in data.get("certificate_items", [])}
+    rows = [
+        ["1.", ("Total value of work actually measured, as per Account I, Col. 5, Entry [A]", 4), "[A]", data["payable_amount"]],
+        ["2.", ("Total up-to-date advance payments for work not yet measured as per details given below:", 6)],
+        ["", ("(a) Total as per previous bill", 4), "[B]", 0],
+        ["", ("(b) Since previous bill...............as per page ........of M.B. No. ..........", 4), "[D]", 0],
+        ["3.", ("Total up-to-date secured advances on security of materials as per Annexure (Form 26-A) Col. 8 Entry", 4), "[C]", 0],
+        ["4.", ("Total (Items 1 + 2 + 3) A+B+C", 5), data["total_123"]],
+        ["5.", ("Deduct: Amount withheld", 5), ""],
+        ["", ("(a) From previous bill as per last Running Account Bill", 3), 0, "[5]", ""],
+        ["", ("(b) From this bill", 3), 0, "", ""],
+        ["6.", ('Balance i.e. "up-to-date" payments (Item 4-5) = Total - Deductions', 5), data["balance_4_minus_5"]],
+        ["7.", ("Total amount of payments already made as per Entry (K), of last Running Account Bill", 4), "(K)",
+         data["amount_paid_last_bill"]],
+        ["8.", ("Payments now to be made, as detailed below:", 5), data["payment_now"]],
+        ["", ("(a) By recovery of amounts creditable to this work", 4), "[a]", ""]
+    ]
+    for label in ("S.D. @ 10%", "I.T. @ 2%", "GST @ 2% [Rounded to even]", "L.C. @ 1%", "Deposit-V", "Liquidated Damages"):
+        rows.append(["", "", "", label, recoveries.get(label, ""), "", ""])
+    rows += [
+        ["", "", ("Total recovery of amounts creditable to this work", 2), data["total_recovery"], "", ""],
+        ["", ("(b) By recovery of amount creditable to other works or heads of account", 4), "[b]", 0],
+        ["", ("(c) By cheque", 4), "", data["by_cheque"]],
+        ["", ("Total 8(b) + 8(c)", 4), "[H]", data["by_cheque"]]
+    ]
+    pdf.grid([8, 8, 30, 40, 30, 10, 30], [["", "", "", "", "", "", "Amount Rs."]], rows)
+
+    pdf.paragraph(f"Pay Rs. {data['by_cheque']}")
+    pdf.paragraph(f"Pay Rupees {data['cheque_amount_words']} Only (by cheque)")
+    pdf.ln(6)
+    pdf.paragraph("Dated the ............ 20 ......          Dated initials of Disbursing Officer")
+    pdf.ln(4)
+    pdf.paragraph(f"Received Rupees {data['cheque_amount_words']} Only (by cheque) as per above memorandum, on account of this bill")
+    pdf.paragraph("Signature of Contractor", align="R")
+    pdf.ln(4)
+    pdf.paragraph("Paid by me, vide cheque No. .............. dated ......... 20 ......")
+    pdf.paragraph("Dated initials of person actually making the payment", align="R")
+
+
+SHEET_DRAWERS = {
+    "First Page": draw_first_page,
+    "Last Page": draw_last_page,
+    "Extra Items": draw_extra_items,
+    "Deviation Statement": draw_deviation_statement,
+    "Certificate III": draw_certificate_iii
+}
+
+
+def draw_sheet(sheet_name, data, orientation):
+    """
+    Draw one sheet to PDF.
+    Returns:
+        The PDF as bytes.
+    """
+    pdf = BillPdf(orientation)
+    SHEET_DRAWERS[sheet_name](pdf, data)
+    return bytes(pdf.output())
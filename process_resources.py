@@ -0,0 +1,41 @@
+"""
+Process-wide resources: built once per process, shared by every thread.
+
+Streamlit executes streamlit_app.py again for every run, so a module global
+there does not outlive a rerun. st.cache_resource only stores values for
+calls made on a script thread. The bill job threads, the CLI's worker
+processes and the HTTP service's workers would get a new resource from every
+call. Functions decorated with `process_resource` keep their result in this
+imported module instead, which Streamlit loads once per process.
+"""
+import functools
+import threading
+
+_resources = {}
+_building = {}
+_lock = threading.Lock()
+
+
+def process_resource(func):
+    """
+    Decorator: build func(*args) once per process and return the same object
+    on later calls with the same arguments, from any thread. Concurrent first
+    calls wait for one build. A build that raises is not kept, so the next
+    call tries again.
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        key = (name, args)
+        try:
+            return _resources[key]
+        except KeyError:
+            pass
+        with _lock:
+            build_lock = _building.setdefault(key, threading.Lock())
+        with build_lock:
+            if key not in _resources:
+                _resources[key] = func(*args)
+            return _resources[key]
+    return wrapper
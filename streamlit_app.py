@@ -1,42 +1,174 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+from pandas.io.parsers import TextParser
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from openpyxl.utils.exceptions import InvalidFileException
 import os
 import zipfile
-import shutil
 from datetime import datetime
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.section import WD_ORIENT
 import tempfile
-import pdfkit
-from PyPDF2 import PdfMerger
-import base64
-from jinja2 import Environment, FileSystemLoader
-from pypdf import PdfReader, PdfWriter
-import num2words
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import platform
+import re
+import io
+import hashlib
+import json
+from collections import Counter, OrderedDict
+from itertools import islice
 import traceback
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
+import threading
+import uuid
+import time
+import sys
+import logging
+import contextvars
+import cProfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
 
-# Temporary directory
-TEMP_DIR = tempfile.mkdtemp()
+from process_resources import process_resource
 
-# Configure wkhtmltopdf
-if platform.system() == "Windows":
-    wkhtmltopdf_path = r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
-    config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
-else:
-    config = pdfkit.configuration()
+# pdfkit, pypdf, python-docx, num2words and jinja2 are imported inside the
+# functions that use them: Streamlit runs this script for every session and
+# rerun, and the page should render without loading the output machinery.
+
+# Rendered sheet HTML is saved here for debugging when set
+DEBUG_HTML_DIR = os.environ.get("BILL_DEBUG_HTML_DIR", "")
+
+@process_resource
+def get_pdfkit_config():
+    """
+    Locate wkhtmltopdf once per process, on the first render rather than on
+    every script run or sheet.
+    """
+    import pdfkit
+    if platform.system() == "Windows":
+        wkhtmltopdf_path = r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
+        return pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
+    return pdfkit.configuration()
+
+# Concurrent wkhtmltopdf processes per bill. Each sheet mostly waits on its
+# javascript-delay, so this can exceed the CPU count.
+PDF_WORKERS = int(os.environ.get("BILL_PDF_WORKERS", "4"))
+
+# wkhtmltopdf processes allowed at once across all sessions and bills of this
+# process; renders beyond it wait for a free slot. The limit is per process:
+# bill_service.py and bill_cli.py run bills in worker processes, so they can
+# run up to BILL_CONVERTER_SLOTS x workers converters at once
+CONVERTER_SLOTS = int(os.environ.get("BILL_CONVERTER_SLOTS", "4"))
+
+# "wkhtmltopdf" renders every sheet from its HTML template. "direct" draws the
+# table sheets in process with the optional fpdf2 package (pdf_direct.py) and
+# uses wkhtmltopdf only for the Note Sheet.
+PDF_BACKEND = os.environ.get("BILL_PDF_BACKEND", "wkhtmltopdf")
+
+# "per_sheet" runs one converter per sheet; "batched" runs one per group of
+# consecutive sheets that share page options; "chunked" is per_sheet with long
+# item tables split into segments of BILL_CHUNK_ROWS items, merged as they finish
+RENDER_MODE = os.environ.get("BILL_RENDER_MODE", "per_sheet")
+CHUNK_ROWS = int(os.environ.get("BILL_CHUNK_ROWS", "2000"))
+
+# Rendered PDFs are reused across runs; set BILL_PDF_CACHE_MB=0 to disable
+PDF_CACHE_DIR = os.environ.get("BILL_PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "bill_pdf_cache"))
+PDF_CACHE_MAX_MB = int(os.environ.get("BILL_PDF_CACHE_MB", "200"))
+
+# The merged bill is rewritten with shared fonts and images stored once and
+# uncompressed page content deflated; set BILL_PDF_OPTIMIZE=0 to skip
+PDF_OPTIMIZE = os.environ.get("BILL_PDF_OPTIMIZE", "1") != "0"
+
+# SQLite running-account store (bill_store.py) that carries up-to-date
+# quantities from one bill of an agreement to the next; empty disables it
+STORE_PATH = os.environ.get(
+    "BILL_STORE_PATH", os.path.join(os.path.expanduser("~"), ".bill_generator", "running_account.sqlite3")
+)
+
+@process_resource
+def running_account_store():
+    """The running-account store, or None when BILL_STORE_PATH is empty."""
+    if not STORE_PATH:
+        return None
+    from bill_store import RunningAccountStore
+    return RunningAccountStore(STORE_PATH)
+
+# Arrow store (work_order_store.py) of the cleaned Work Order items of each
+# agreement, reused by its later bills; empty disables it, as does a missing
+# pyarrow. Entries unused for BILL_WORK_ORDER_DAYS are evicted, then the least
+# recently used past BILL_WORK_ORDER_MB
+WORK_ORDER_DIR = os.environ.get(
+    "BILL_WORK_ORDER_DIR", os.path.join(os.path.expanduser("~"), ".bill_generator", "work_orders")
+)
+WORK_ORDER_MAX_MB = int(os.environ.get("BILL_WORK_ORDER_MB", "200"))
+WORK_ORDER_MAX_AGE_DAYS = float(os.environ.get("BILL_WORK_ORDER_DAYS", "180"))
+
+@process_resource
+def work_order_store():
+    """The work-order store, or None when BILL_WORK_ORDER_DIR is empty or pyarrow is not installed."""
+    if not WORK_ORDER_DIR:
+        return None
+    try:
+        from work_order_store import WorkOrderStore
+    except ImportError:
+        return None
+    return WorkOrderStore(WORK_ORDER_DIR, WORK_ORDER_MAX_MB * 1024 * 1024, WORK_ORDER_MAX_AGE_DAYS)
+
+# Each bill run logs its timing spans as one JSON line ("bill" logger); spans
+# are also logged individually at DEBUG
+LOG_LEVEL = os.environ.get("BILL_LOG_LEVEL", "INFO").upper()
+# Resident memory is sampled this often while a bill run is measured, for the
+# peak memory of the run and of each span
+MEMORY_SAMPLE_SECONDS = float(os.environ.get("BILL_MEMORY_SAMPLE_MS", "5")) / 1000
+# "cprofile" or "pyinstrument" (optional package) writes a profile of every
+# bill run to BILL_PROFILE_DIR; empty disables profiling
+PROFILER = os.environ.get("BILL_PROFILE", "").lower()
+PROFILE_DIR = os.environ.get("BILL_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "bill_profiles"))
+
+logger = logging.getLogger("bill")
+if not logger.handlers:
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(log_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
 
 # Set up Jinja2 environment
-env = Environment(loader=FileSystemLoader("templates"), cache_size=0)
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+# Optional on-disk cache of compiled template bytecode, shared between processes
+JINJA_BYTECODE_DIR = os.environ.get("BILL_JINJA_BYTECODE_DIR", "")
+
+@process_resource
+def get_template_env():
+    """
+    Build the Jinja2 environment once per process and compile every template.
+    Streamlit re-executes this module on each rerun, so the environment is a
+    process resource instead of a module global; it is shared with the bill
+    job threads, the CLI workers and the benchmarks. It is built on the first
+    render, not at start-up. Compiled templates are kept until their file's
+    mtime changes (auto_reload), so edits under templates/ still show up
+    without a restart.
+    """
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+    bytecode_cache = None
+    if JINJA_BYTECODE_DIR:
+        os.makedirs(JINJA_BYTECODE_DIR, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(JINJA_BYTECODE_DIR)
+    template_env = Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        cache_size=100,
+        auto_reload=True,
+        bytecode_cache=bytecode_cache
+    )
+    for template_name in template_env.list_templates(extensions=["html"]):
+        template_env.get_template(template_name)
+    return template_env
 
 # Helper functions
 def number_to_words(number):
+    import num2words
     try:
-        return num2words(number, lang='en_IN')
+        return num2words.num2words(number, lang='en_IN')
     except:
         return str(number)
 
@@ -48,6 +180,8 @@ def set_cell_border(cell, **kwargs):
         kwargs: Dictionary with border settings for 'top', 'left', 'bottom', 'right'.
                 Each border can have 'val', 'sz', 'color' attributes.
     """
+    from docx.oxml.ns import qn
+    from docx.oxml.parser import OxmlElement
     tc = cell._tc
     tcPr = tc.get_or_add_tcPr()
     tcBorders = tcPr.find(qn('w:tcBorders'))
@@ -67,21 +201,783 @@ def set_cell_border(cell, **kwargs):
                 tcBorders.remove(existing_edge)
             tcBorders.append(edge_element)
 
-def merge_pdfs(pdf_files, output_path):
-    merger = PdfMerger()
+def merge_pdfs(pdf_files, output_path=None):
+    """
+    Merge PDFs, given as file paths or bytes, in order.
+    Writes to `output_path` when it is given, otherwise returns the merged bytes.
+    """
+    from pypdf import PdfWriter
+    writer = PdfWriter()
     for pdf in pdf_files:
-        if os.path.exists(pdf):
-            merger.append(pdf)
-    merger.write(output_path)
-    merger.close()
+        if isinstance(pdf, bytes):
+            writer.append(io.BytesIO(pdf))
+        elif os.path.exists(pdf):
+            writer.append(pdf)
+    if output_path is None:
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+    writer.write(output_path)
 
-import pandas as pd
-import numpy as np
+def pdf_object_digest(obj, digests):
+    """
+    Content hash of a PDF object, following indirect references. Streams are
+    hashed on their stored bytes, so two objects get the same digest only if
+    they would be written out identically. `digests` memoizes indirect
+    objects by id and guards against reference cycles.
+    """
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in digests:
+            digests[key] = f"cycle {key}".encode()
+            digests[key] = pdf_object_digest(obj.get_object(), digests)
+        return digests[key]
+    h = hashlib.sha1(type(obj).__name__.encode())
+    if isinstance(obj, DictionaryObject):
+        for name in sorted(obj):
+            h.update(name.encode())
+            h.update(pdf_object_digest(obj.raw_get(name), digests))
+        if isinstance(obj, StreamObject):
+            h.update(obj._data)
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            h.update(pdf_object_digest(item, digests))
+    else:
+        h.update(repr(obj).encode())
+    return h.digest()
+
+def share_identical_resources(obj, digests, canonical, visited):
+    """
+    Point every reference under `obj` at the first object seen with the same
+    content, so identical fonts and images from different source PDFs are
+    written once.
+    """
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject
+    items = obj.items() if isinstance(obj, DictionaryObject) else enumerate(obj)
+    for key, value in list(items):
+        if isinstance(value, IndirectObject):
+            first = canonical.setdefault(pdf_object_digest(value, digests), value)
+            if first is not value:
+                obj[key] = first
+                continue
+            if value.idnum in visited:
+                continue
+            visited.add(value.idnum)
+            value = value.get_object()
+        if isinstance(value, (DictionaryObject, ArrayObject)):
+            share_identical_resources(value, digests, canonical, visited)
+
+def optimize_pdf(pdf_bytes):
+    """
+    Shrink a merged PDF: fonts, images and forms that the source PDFs each
+    embedded are stored once, objects no page uses any more are dropped, and
+    page content streams without a filter are deflated. Images are kept as
+    they are.
+    Returns:
+        (optimized bytes, size before, size after). The input is returned
+        unchanged if rewriting it did not make it smaller.
+    """
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    digests, canonical, visited = {}, {}, set()
+    for page in reader.pages:
+        resources = page.get("/Resources")
+        if resources is not None:
+            share_identical_resources(resources.get_object(), digests, canonical, visited)
+
+    # Appending copies only what the pages still reference
+    writer = PdfWriter()
+    writer.append(reader)
+    for page in writer.pages:
+        contents = page.get("/Contents")
+        streams = contents.get_object() if contents is not None else []
+        if not isinstance(streams, list):
+            streams = [streams]
+        if any("/Filter" not in stream.get_object() for stream in streams):
+            page.compress_content_streams()
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    optimized = buffer.getvalue()
+    if len(optimized) >= len(pdf_bytes):
+        optimized = pdf_bytes
+    log_event("pdf_optimized", bytes_before=len(pdf_bytes), bytes_after=len(optimized))
+    return optimized, len(pdf_bytes), len(optimized)
+
+# Sheet ingestion
+ITEM_START_ROW = 21  # First item row (0-based) of the Work Order and Bill Quantity sheets
+ITEM_COLUMNS = 7  # Columns A-G
+
+# Cells containing any of these words are column titles or totals, not values
+HEADER_KEYWORDS = (
+    "qty", "quantity", "rate", "amount", "sno", "serial", "unit",
+    "description", "item", "total", "grand", "sub", "header"
+)
+HEADER_PATTERN = re.compile("|".join(re.escape(keyword) for keyword in HEADER_KEYWORDS))
+NUMBER_TYPES = (int, float, np.int64, np.float64)
+
+def item_region(frame, first_row):
+    """Slice columns A-G from `first_row` down, padding missing columns with NaN."""
+    region = frame[frame.index >= first_row].iloc[:, :ITEM_COLUMNS]
+    region = region.set_axis(range(region.shape[1]), axis=1)
+    return region.reindex(columns=range(ITEM_COLUMNS)).astype(object)
+
+def text_column(column):
+    """Convert a column to strings, with empty cells as ""."""
+    return column.where(column.notna(), "").astype(str)
+
+def clean_numeric_column(column):
+    """
+    Clean and convert a whole column to floats.
+    Empty cells become 0.0. Cells holding header text or anything float()
+    cannot parse are flagged invalid.
+    Returns:
+        (values, valid): float array and boolean mask of parsed cells.
+    """
+    missing = (column.isna() | column.eq("")).to_numpy()
+    is_number = column.map(type).isin(NUMBER_TYPES).to_numpy() & ~missing
+    is_text = ~missing & ~is_number
+
+    values = np.zeros(len(column), dtype=float)
+    valid = missing | is_number
+    values[is_number] = column[is_number].to_numpy(dtype=float)
+
+    if is_text.any():
+        text = column[is_text].astype(str).str.replace("%", "", regex=False).str.strip()
+        text = text[~text.str.lower().str.contains(HEADER_PATTERN)]
+        parsed = {}
+        for value in text.unique():
+            try:
+                parsed[value] = float(value)
+            except ValueError:
+                pass
+        text = text[text.isin(parsed.keys())]
+        positions = column.index.get_indexer(text.index)
+        values[positions] = text.map(parsed).to_numpy(dtype=float)
+        valid[positions] = True
+
+    return values, valid
+
+# Row-level problems kept per bill for its validation report; past this
+# many only their count is kept
+MAX_ISSUES = int(os.environ.get("BILL_MAX_ISSUES", "1000"))
+ISSUE_COLUMNS = ["sheet", "row", "column", "value", "reason"]
+# Rows of the validation report shown per page
+ISSUE_PAGE_ROWS = 200
+
+class ValidationReport:
+    """
+    Row-level problems found in a bill's workbook, one per cell: values that
+    are not numbers (the row is skipped), repeated BSR codes and Bill lines
+    matching no Work Order item. Keeps the first `limit` issues and counts
+    the rest.
+    """
+
+    def __init__(self, limit=MAX_ISSUES):
+        self.limit = limit
+        self.issues = []
+        self.total = 0
+
+    def add(self, sheet, row, column, value, reason):
+        self.total += 1
+        if len(self.issues) < self.limit:
+            self.issues.append({"sheet": sheet, "row": row, "column": column, "value": value, "reason": reason})
+
+    def merge(self, found):
+        """Add issues found at ingestion: {"issues": [...], "total": count}."""
+        for issue in found["issues"]:
+            self.add(**issue)
+        self.total += found["total"] - len(found["issues"])
+
+    @property
+    def dropped(self):
+        return self.total - len(self.issues)
+
+    def to_frame(self):
+        frame = pd.DataFrame(self.issues, columns=ISSUE_COLUMNS)
+        frame["value"] = frame["value"].astype(str)
+        return frame
+
+    def to_csv(self):
+        return self.to_frame().to_csv(index=False).encode("utf-8")
+
+def invalid_cells(sheet, region, skipped, checks, limit=MAX_ISSUES):
+    """
+    Report the cells that failed to parse in the skipped rows of a sheet
+    region, row by row.
+    Args:
+        skipped: Boolean mask of the skipped rows of `region`.
+        checks: {column: (name, valid mask)} of the parsed columns.
+    Returns:
+        {"issues": the first `limit` issues, "total": count of all}.
+    """
+    invalid = {column: skipped & ~valid for column, (_, valid) in checks.items()}
+    issues = []
+    # Every skipped row has at least one invalid cell
+    for position in np.flatnonzero(skipped)[:limit]:
+        for column, (name, _) in checks.items():
+            if invalid[column][position] and len(issues) < limit:
+                issues.append({
+                    "sheet": sheet,
+                    "row": int(region.index[position]) + 1,
+                    "column": f"{chr(ord('A') + column)} ({name})",
+                    "value": region.iat[position, column],
+                    "reason": "Not a number; the row is skipped"
+                })
+    return {"issues": issues, "total": int(sum(mask.sum() for mask in invalid.values()))}
+
+def ingest_items(ws, qty_key, sheet):
+    """
+    Read the item rows of a Work Order or Bill Quantity sheet.
+    Rows without serial number, description and unit are ignored; rows with
+    invalid qty/rate/amount are skipped and their invalid cells reported.
+    Returns:
+        (items, issues): ItemTable of the kept rows, with their sheet row,
+        and the invalid_cells report.
+    """
+    region = item_region(ws, ITEM_START_ROW)
+    qty, qty_valid = clean_numeric_column(region[3])
+    rate, rate_valid = clean_numeric_column(region[4])
+    amount, amount_valid = clean_numeric_column(region[5])
+    items = pd.DataFrame({
+        "serial_no": text_column(region[0]),
+        "description": text_column(region[1]),
+        "unit": text_column(region[2]),
+        qty_key: qty,
+        "rate": rate,
+        "amount": amount,
+        "bsr": text_column(region[6]),
+        "row": region.index + 1
+    }, index=region.index)
+
+    blank = ((items["serial_no"] == "") & (items["description"] == "") & (items["unit"] == "")).to_numpy()
+    valid = qty_valid & rate_valid & amount_valid
+    issues = invalid_cells(sheet, region, ~blank & ~valid, {3: ("qty", qty_valid), 4: ("rate", rate_valid), 5: ("amount", amount_valid)})
+    kept = items[~blank & valid]
+    return ItemTable({
+        name: kept[name].tolist() if kept[name].dtype == object else kept[name].to_numpy()
+        for name in kept.columns
+    }), issues
+
+def ingest_extra_items(ws_extra):
+    """
+    Read the Extra Items sheet from its first row.
+    Rows with an empty first column are ignored; rows with invalid
+    qty/rate/amount are skipped and their invalid cells reported.
+    Returns:
+        (items, issues): item dicts and the invalid_cells report.
+    """
+    region = item_region(ws_extra, 0)
+    listed = ~(region[0].isna() | region[0].eq("")).to_numpy()
+    qty, qty_valid = clean_numeric_column(region[4])
+    rate, rate_valid = clean_numeric_column(region[5])
+    amount, amount_valid = clean_numeric_column(region[6])
+    items = pd.DataFrame({
+        "serial_no": text_column(region[0]),
+        "description": text_column(region[2]),
+        "unit": text_column(region[3]),
+        "qty_bill": qty,
+        "rate": rate,
+        "amount": amount
+    }, index=region.index)
+
+    valid = qty_valid & rate_valid & amount_valid
+    issues = invalid_cells("Extra Items", region, listed & ~valid, {4: ("qty", qty_valid), 5: ("rate", rate_valid), 6: ("amount", amount_valid)})
+    return items[listed & valid].to_dict("records"), issues
+
+# Numeric item columns, stored as float arrays; the others are lists of strings
+ITEM_NUMBER_COLUMNS = (
+    "qty_wo", "rate", "amt_wo", "qty_bill", "amt_bill", "qty_since_last", "amount_since_prev",
+    "excess_qty", "excess_amt", "saving_qty", "saving_amt"
+)
+ITEM_TEXT_COLUMNS = ("serial_no", "description", "unit", "bsr", "remark")
+# Item columns set by compute_bill_totals
+ITEM_EXCESS_COLUMNS = ("excess_qty", "excess_amt", "saving_qty", "saving_amt")
+# Row keys of each table over the bill's item columns: key -> column
+DEVIATION_FIELDS = {
+    "serial_no": "serial_no", "description": "description", "unit": "unit",
+    "qty_wo": "qty_wo", "rate": "rate", "amt_wo": "amt_wo", "qty_bill": "qty_bill", "amt_bill": "amt_bill",
+    "excess_qty": "excess_qty", "excess_amt": "excess_amt", "saving_qty": "saving_qty", "saving_amt": "saving_amt",
+    "remark": "remark"
+}
+FIRST_PAGE_FIELDS = {
+    "unit": "unit", "qty_since_last": "qty_since_last", "qty_upto_date": "qty_bill",
+    "serial_no": "serial_no", "description": "description", "rate": "rate",
+    "amount_upto_date": "amt_bill", "amount_since_prev": "amount_since_prev", "remark": "remark", "bsr": "bsr"
+}
+
+class ItemRow:
+    """
+    Read-only view of one ItemTable row. Supports item["key"], item.get()
+    and attribute access, so templates, the Word writer and the PDF drawer
+    use it as they used the per-row dicts.
+    """
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._table.columns[self._table.fields[key]][self._index]
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __contains__(self, key):
+        return key in self._table.fields
+
+    def get(self, key, default=None):
+        return self[key] if key in self._table.fields else default
+
+    def keys(self):
+        return self._table.fields.keys()
+
+    def to_dict(self):
+        return {key: self[key] for key in self._table.fields}
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+class ItemTable:
+    """
+    Bill items stored by column: float arrays for quantities, rates and
+    amounts, lists for the text. The First Page, Deviation Statement and
+    Extra Items tables are views over one set of columns, each with its own
+    row keys (`fields`) and rows, so a description or amount is stored once
+    however many tables show it. Iterating yields ItemRow views.
+    """
+
+    def __init__(self, columns, fields=None, rows=None):
+        self.columns = columns
+        self.fields = fields if fields is not None else {name: name for name in columns}
+        self.rows = rows if rows is not None else range(len(next(iter(columns.values()), ())))
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a table from dicts holding every item column but the ITEM_EXCESS_COLUMNS."""
+        columns = {
+            name: np.array([record[name] for record in records], dtype=float)
+            for name in ITEM_NUMBER_COLUMNS if name not in ITEM_EXCESS_COLUMNS
+        }
+        columns.update({name: [record[name] for record in records] for name in ITEM_TEXT_COLUMNS})
+        return cls(columns)
+
+    def concat(self, other):
+        """A new table with the rows of `other` after this one's."""
+        columns = {}
+        for name, values in self.columns.items():
+            if isinstance(values, np.ndarray):
+                columns[name] = np.concatenate([values[self.rows], other.columns[name][other.rows]])
+            else:
+                columns[name] = [values[i] for i in self.rows] + [other.columns[name][i] for i in other.rows]
+        return ItemTable(columns)
+
+    def view(self, fields, start=0, stop=None):
+        """The rows start:stop of this table, keyed by `fields`."""
+        return ItemTable(self.columns, fields, self.rows[start:stop])
+
+    def column(self, key):
+        """Values of one row key over the table's rows, as an array."""
+        values = self.columns[self.fields[key]][self.rows.start:self.rows.stop:self.rows.step]
+        return values if isinstance(values, np.ndarray) else np.array(values, dtype=object)
+
+    def to_records(self):
+        return [row.to_dict() for row in self]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return (ItemRow(self, index) for index in self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ItemTable(self.columns, self.fields, self.rows[index])
+        return ItemRow(self, self.rows[index])
+
+    def __repr__(self):
+        return f"ItemTable({self.to_records()!r})"
+
+def join_items_by_bsr(wo_items, bill_items, previous_items=None):
+    """
+    Join Work Order and Bill items on BSR code in a single pass.
+    A Work Order item takes the first Bill line with its BSR code, or zero
+    quantity and amount when there is none. Bill quantities are up to date;
+    the quantity and amount since the last certificate are what they add to
+    the previous bill's.
+    Args:
+        wo_items, bill_items: ItemTables from ingest_items.
+        previous_items: {bsr: (qty_upto_date, amount_upto_date)} of the
+            previous bill, from the running-account store. None for a first
+            bill, where everything is since the last certificate.
+    Returns:
+        (items, report): an ItemTable with every item column but the
+        ITEM_EXCESS_COLUMNS, one row per Work Order item, and a report with
+        the lines repeating a BSR code as (sheet, item, count) and the Bill
+        lines that matched nothing.
+    """
+    wo_bsrs = wo_items.column("bsr").tolist()
+    bill_bsrs = bill_items.column("bsr").tolist()
+    bill_rows = {}
+    for index, bsr in enumerate(bill_bsrs):
+        bill_rows.setdefault(bsr, index)
+
+    count = len(wo_items)
+    matched = np.array([bill_rows.get(bsr, -1) for bsr in wo_bsrs], dtype=np.int64)
+    found = matched >= 0
+    qty_bill = np.zeros(count)
+    amt_bill = np.zeros(count)
+    qty_bill[found] = bill_items.column("qty_bill")[matched[found]]
+    amt_bill[found] = bill_items.column("amount")[matched[found]]
+    previous_items = previous_items or {}
+    previous = np.array([previous_items.get(bsr, (0, 0)) for bsr in wo_bsrs], dtype=float).reshape(count, 2)
+
+    items = ItemTable({
+        "serial_no": wo_items.column("serial_no").tolist(),
+        "description": wo_items.column("description").tolist(),
+        "unit": wo_items.column("unit").tolist(),
+        "bsr": wo_bsrs,
+        "remark": [""] * count,
+        "qty_wo": np.asarray(wo_items.column("qty_wo"), dtype=float),
+        "rate": np.asarray(wo_items.column("rate"), dtype=float),
+        "amt_wo": np.asarray(wo_items.column("amount"), dtype=float),
+        "qty_bill": qty_bill,
+        "amt_bill": amt_bill,
+        "qty_since_last": qty_bill - previous[:, 0],
+        "amount_since_prev": amt_bill - previous[:, 1]
+    })
 
-def process_bill(ws_wo, ws_bq, ws_extra, premium_percent, premium_type, amount_paid_last_bill, is_first_bill, user_inputs):
+    duplicates = []
+    for sheet, sheet_items, bsrs in (("Work Order", wo_items, wo_bsrs), ("Bill Quantity", bill_items, bill_bsrs)):
+        counts = Counter(bsr for bsr in bsrs if bsr)
+        duplicates.extend((sheet, sheet_items[index], counts[bsr]) for index, bsr in enumerate(bsrs) if counts[bsr] > 1)
+    wo_bsr_set = set(wo_bsrs)
+    unmatched = [bill_items[index] for index, bsr in enumerate(bill_bsrs) if bsr not in wo_bsr_set]
+    return items, {"duplicates": duplicates, "unmatched": unmatched}
+
+def compute_bill_totals(items, work_order_count, premium_percent, premium_type):
+    """
+    Set the excess and saving columns of the bill's items and compute every
+    total of the bill from the item columns. Work Order items exceed or save
+    on the difference between executed and Work Order quantity, at the Work
+    Order rate; extra items (the rows from `work_order_count` on) are excess
+    in full.
+    Amounts are summed unrounded and each total is rounded to 2 decimals
+    once; premiums are figured on the rounded totals, so every sheet showing
+    a figure shows the same one.
+    Args:
+        items: ItemTable of the Work Order items followed by the extra items,
+            without the ITEM_EXCESS_COLUMNS.
+        premium_type: "Above" adds the tender premium, "Below" deducts it.
+    Returns:
+        The Deviation Statement summary: Work Order, executed, excess and
+        saving totals (columns f, h, j and l of the statement), their tender
+        premiums and grand totals, the net difference, and the extra items'
+        total, premium and payable amount. The bill's payable amount is
+        grand_total_h.
+    """
+    columns = items.columns
+    qty_wo, qty_bill, rate, amt_bill = columns["qty_wo"], columns["qty_bill"], columns["rate"], columns["amt_bill"]
+    # Not np.maximum: a NaN difference counts as 0, as max(0, nan) does
+    excess_qty = np.where(qty_bill - qty_wo > 0, qty_bill - qty_wo, 0.0)
+    saving_qty = np.where(qty_wo - qty_bill > 0, qty_wo - qty_bill, 0.0)
+    with np.errstate(invalid="ignore"):
+        # An infinite rate gives NaN amounts, as it did per row
+        excess_amt = excess_qty * rate
+        saving_amt = saving_qty * rate
+    extra = slice(work_order_count, None)
+    excess_qty[extra] = qty_bill[extra]
+    excess_amt[extra] = amt_bill[extra]
+    saving_qty[extra] = 0.0
+    saving_amt[extra] = 0.0
+    columns.update({"excess_qty": excess_qty, "excess_amt": excess_amt, "saving_qty": saving_qty, "saving_amt": saving_amt})
+
+    def amount(value):
+        # Adding 0.0 turns a -0.0 (a zero total at a "Below" premium) into 0.0
+        return round(float(value), 2) + 0.0
+
+    premium_fraction = float(premium_percent) / 100
+    signed_fraction = -premium_fraction if str(premium_type).lower() == "below" else premium_fraction
+    summary = {
+        "premium": {"percent": premium_fraction, "type": premium_type},
+        "work_order_total": amount(columns["amt_wo"].sum()),
+        "executed_total": amount(amt_bill.sum()),
+        "overall_excess": amount(excess_amt.sum()),
+        "overall_saving": amount(saving_amt.sum())
+    }
+    for column, key in zip("fhjl", ("work_order_total", "executed_total", "overall_excess", "overall_saving")):
+        summary[f"tender_premium_{column}"] = amount(summary[key] * signed_fraction)
+        summary[f"grand_total_{column}"] = amount(summary[key] + summary[f"tender_premium_{column}"])
+    summary["net_difference"] = amount(summary["grand_total_h"] - summary["grand_total_f"])
+
+    extra_total = amount(amt_bill[extra].sum())
+    summary["extra_items_total"] = extra_total
+    summary["extra_items_premium"] = amount(extra_total * signed_fraction)
+    summary["extra_items_payable"] = amount(extra_total + summary["extra_items_premium"])
+    return summary
+
+# Sheets read from a bill workbook and the first row (0-based) each one needs
+BILL_SHEETS = {"Work Order": ITEM_START_ROW, "Bill Quantity": ITEM_START_ROW, "Extra Items": 0}
+# "openpyxl" streams in read-only mode; "calamine" needs the optional python-calamine
+# package; "auto" uses calamine when it is installed
+EXCEL_ENGINE = os.environ.get("BILL_EXCEL_ENGINE", "auto")
+
+def excel_cell(value):
+    """
+    Convert a raw cell value the way pandas.read_excel's reader does before
+    parsing: empty cells as "", error cells as NaN and integral floats as int.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return np.nan if value in ERROR_CODES else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def resolve_excel_engine(engine):
+    """Map a configured engine name to "calamine" or "openpyxl"."""
+    if engine == "openpyxl":
+        return engine
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        if engine == "calamine":
+            raise ImportError("The calamine Excel engine needs the python-calamine package")
+        return "openpyxl"
+    return "calamine"
+
+def iter_sheet_rows(source, engine, sheets=BILL_SHEETS):
+    """
+    Yield (sheet_name, rows) for each of `sheets`, rows being lists of raw cell values.
+    Raises:
+        ValueError: The source is not a workbook the engine can read, or
+            lacks one of the sheets.
+    """
+    if resolve_excel_engine(engine) == "calamine":
+        from python_calamine import CalamineError, CalamineWorkbook
+        if hasattr(source, "seek"):
+            source.seek(0)
+        try:
+            workbook = CalamineWorkbook.from_filelike(source) if hasattr(source, "read") else CalamineWorkbook.from_path(source)
+        except CalamineError as e:
+            raise ValueError(f"Not a readable Excel workbook: {e}") from e
+        for sheet_name in sheets:
+            if sheet_name not in workbook.sheet_names:
+                raise ValueError(f"Worksheet named '{sheet_name}' not found")
+            yield sheet_name, workbook.get_sheet_by_name(sheet_name).iter_rows()
+        return
+
+    try:
+        workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    except (zipfile.BadZipFile, InvalidFileException) as e:
+        raise ValueError(f"Not a readable Excel workbook: {e}") from e
+    try:
+        for sheet_name in sheets:
+            if sheet_name not in workbook.sheetnames:
+                raise ValueError(f"Worksheet named '{sheet_name}' not found")
+            sheet = workbook[sheet_name]
+            # Stored dimensions are unreliable in read-only mode
+            sheet.reset_dimensions()
+            yield sheet_name, sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def read_bill_sheets(source, engine=EXCEL_ENGINE, sheets=BILL_SHEETS):
+    """
+    Stream only columns A-G of the Work Order, Bill Quantity and Extra Items
+    sheets into frames equal to pandas.read_excel's for those columns.
+    Cells are converted by excel_cell and parsed by the same TextParser, so
+    each column gets the type read_excel infers over the whole sheet: a
+    numeric column with a blank cell is float, and its text is "1.0", not
+    "1". The serial numbers and BSR codes the stores key on depend on it.
+    Args:
+        source: Path or binary file object of the xlsx workbook.
+        engine: "openpyxl", "calamine" or "auto".
+        sheets: The bill sheets to read; the others are returned as None.
+    Returns:
+        (ws_wo, ws_bq, ws_extra): DataFrames indexed by 0-based sheet row.
+    """
+    frames = {}
+    for sheet_name, rows in iter_sheet_rows(source, engine, sheets):
+        data = []
+        last_row_with_data = -1
+        for row in rows:
+            data.append([excel_cell(value) for value in islice(row, ITEM_COLUMNS)])
+            # read_excel drops trailing empty rows, judged on every column
+            if any(value is not None and value != "" for value in row):
+                last_row_with_data = len(data) - 1
+        data = [row + [""] * (ITEM_COLUMNS - len(row)) for row in data[:last_row_with_data + 1]]
+        frames[sheet_name] = TextParser(data, header=None, skip_blank_lines=False).read() if data else pd.DataFrame()
+    return frames.get("Work Order"), frames.get("Bill Quantity"), frames.get("Extra Items")
+
+XLSX_NAMESPACES = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "rel": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "pkg": "http://schemas.openxmlformats.org/package/2006/relationships"
+}
+# A shared-string cell of a worksheet part, up to the index of its string
+SHARED_STRING_CELL = re.compile(rb'<c\b[^>]*\bt="s"[^>]*>\s*<v>(\d+)</v>')
+
+def sheet_fingerprint(source, sheet_name):
+    """
+    Content hash of one sheet of an xlsx workbook, read from its XML parts:
+    the sheet's cells with shared strings resolved to their text, and the
+    workbook styles that turn cell values into dates and numbers. Saving the
+    workbook again or editing other sheets leaves it unchanged.
+    Args:
+        source: Path or binary file object of the workbook.
+    Returns:
+        Hex digest, or None when the workbook is not an xlsx with that sheet.
+    """
+    import xml.etree.ElementTree as ET
+    try:
+        with zipfile.ZipFile(source) as archive:
+            workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+            sheet = workbook.find(f"main:sheets/main:sheet[@name='{sheet_name}']", XLSX_NAMESPACES)
+            if sheet is None:
+                return None
+            rel_id = sheet.get(f"{{{XLSX_NAMESPACES['rel']}}}id")
+            rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+            target = next(rel.get("Target") for rel in rels.iterfind("pkg:Relationship", XLSX_NAMESPACES)
+                          if rel.get("Id") == rel_id)
+            sheet_xml = archive.read(target.lstrip("/") if target.startswith("/") else f"xl/{target}")
+
+            shared_strings = []
+            if "xl/sharedStrings.xml" in archive.namelist():
+                strings = ET.fromstring(archive.read("xl/sharedStrings.xml"))
+                shared_strings = ["".join(si.itertext()) for si in strings.iterfind("main:si", XLSX_NAMESPACES)]
+            styles = archive.read("xl/styles.xml") if "xl/styles.xml" in archive.namelist() else b""
+    except (zipfile.BadZipFile, KeyError, StopIteration, IndexError, ET.ParseError):
+        return None
+    finally:
+        if hasattr(source, "seek"):
+            source.seek(0)
+
+    digest = hashlib.sha256(styles)
+    start = 0
+    for match in SHARED_STRING_CELL.finditer(sheet_xml):
+        digest.update(sheet_xml[start:match.start(1)])
+        index = int(match.group(1))
+        digest.update(b"\0" + shared_strings[index].encode("utf-8") + b"\0" if index < len(shared_strings) else b"\0")
+        start = match.end(1)
+    digest.update(sheet_xml[start:])
+    return digest.hexdigest()
+
+def ingest_workbook(ws_wo, ws_bq, ws_extra, work_order=None):
+    """
+    Ingest the item sheets of a bill workbook.
+    Args:
+        work_order: (items, issues) of the Work Order sheet, items as an
+            ItemTable, from the work-order store; used instead of ingesting
+            `ws_wo`.
+    Returns:
+        Dict of item lists and invalid cell reports per sheet. Extra Items
+        entries are None when there is no Extra Items sheet.
+    """
+    wo_items, wo_issues = work_order if work_order is not None else ingest_items(ws_wo, "qty_wo", "Work Order")
+    bill_items, bill_issues = ingest_items(ws_bq, "qty_bill", "Bill Quantity")
+    extra_items, extra_issues = ingest_extra_items(ws_extra) if ws_extra is not None else (None, None)
+    return {
+        "wo_items": wo_items,
+        "wo_issues": wo_issues,
+        "bill_items": bill_items,
+        "bill_issues": bill_issues,
+        "extra_items": extra_items,
+        "extra_issues": extra_issues
+    }
+
+def ingest_bill_workbook(source, agreement_no="", engine=EXCEL_ENGINE):
+    """
+    Read and ingest a bill workbook. With an agreement number, the Work Order
+    items come from the work-order store when an earlier bill of the
+    agreement had the same Work Order sheet, and the sheet is not read;
+    otherwise they are ingested and stored for the agreement's next bill.
+    Args:
+        source: Path or binary file object of the xlsx workbook.
+    Returns:
+        Output of ingest_workbook.
+    """
+    store = work_order_store() if agreement_no else None
+    fingerprint = sheet_fingerprint(source, "Work Order") if store is not None else None
+    if fingerprint is not None:
+        with timed("work_order_lookup"):
+            stored = store.get(agreement_no, fingerprint)
+        if stored is not None:
+            columns, issues = stored
+            log_event("work_order_reused", agreement_no=agreement_no, items=len(columns["bsr"]))
+            sheets = [sheet_name for sheet_name in BILL_SHEETS if sheet_name != "Work Order"]
+            return ingest_workbook(*read_bill_sheets(source, engine, sheets), work_order=(ItemTable(columns), issues))
+
+    ingested = ingest_workbook(*read_bill_sheets(source, engine))
+    if fingerprint is not None:
+        # The store only saves work; a bill is not failed for it
+        try:
+            with timed("work_order_store"):
+                store.put(agreement_no, fingerprint, ingested["wo_items"].columns, ingested["wo_issues"])
+        except OSError as e:
+            log_event("work_order_store_failed", level=logging.WARNING, agreement_no=agreement_no, error=str(e))
+    return ingested
+
+# Ingested uploads kept in memory, so regenerating a bill after a sidebar change
+# does not read its workbook again
+INGEST_CACHE_ENTRIES = 8
+
+class IngestedWorkbooks:
+    """
+    The most recently used ingested uploads of the process, keyed by
+    (upload hash, agreement number). Shared by every session and bill job;
+    the ingested items are only read by the pipeline, never changed.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            ingested = self._entries.get(key)
+            if ingested is not None:
+                self._entries.move_to_end(key)
+            return ingested
+
+    def put(self, key, ingested):
+        with self._lock:
+            self._entries[key] = ingested
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+@process_resource
+def ingested_workbooks():
+    """The process-wide IngestedWorkbooks."""
+    return IngestedWorkbooks(INGEST_CACHE_ENTRIES)
+
+def load_workbook_items(upload_hash, agreement_no, file_bytes):
+    """
+    Parse and ingest an uploaded workbook, or take it from
+    ingested_workbooks() when the same upload was ingested for the same
+    agreement before.
+    Args:
+        upload_hash: Content hash of the upload.
+    """
+    cache = ingested_workbooks()
+    ingested = cache.get((upload_hash, agreement_no))
+    if ingested is None:
+        ingested = ingest_bill_workbook(io.BytesIO(file_bytes), agreement_no)
+        cache.put((upload_hash, agreement_no), ingested)
+    return ingested
+
+def process_bill(ws_wo, ws_bq, ws_extra, premium_percent, premium_type, amount_paid_last_bill, is_first_bill, user_inputs, ingested=None, previous_items=None):
     try:
         # Initialize output structures
-        data = {"items": []}  # For First Page table
+        data = {"items": [], "extra_items": [], "validation": ValidationReport()}  # For First Page table and Extra Items sheet
         deviation_data = {"items": [], "summary": {}}  # For Deviation Statement
         header_data = {
             "deviation_headers": [
@@ -93,182 +989,62 @@ def process_bill(ws_wo, ws_bq, ws_extra, premium_percent, premium_type, amount_p
             "tender_premium_bill": 0
         }
 
-        # Read Work Order and Bill sheets
-        ws_bill = ws_bq  # Using ws_bq as the bill sheet
-
-        def is_header_or_invalid(value):
-            """Check if a value indicates a header or invalid data."""
-            if pd.isna(value):
-                return True
-            value_str = str(value).lower().strip()
-            header_keywords = [
-                "qty", "quantity", "rate", "amount", "sno", "serial", "unit",
-                "description", "item", "total", "grand", "sub", "header"
-            ]
-            return any(keyword in value_str for keyword in header_keywords)
-
-        def clean_numeric(value):
-            """Clean and convert a value to float, return None if invalid."""
-            if pd.isna(value) or value == "":
-                return 0.0
-            value_str = str(value).replace('%', '').strip()
-            if is_header_or_invalid(value_str):
-                return None
-            try:
-                return float(value_str)
-            except ValueError:
-                return None
-
-        # Process Work Order items (start from row 21, 0-based index)
-        wo_items = []
-        for i in range(21, ws_wo.shape[0]):  # Changed from 20 to 21
-            serial_no = str(ws_wo.iloc[i, 0]) if pd.notnull(ws_wo.iloc[i, 0]) else ""
-            description = str(ws_wo.iloc[i, 1]) if pd.notnull(ws_wo.iloc[i, 1]) else ""
-            unit = str(ws_wo.iloc[i, 2]) if pd.notnull(ws_wo.iloc[i, 2]) else ""
-            
-            # Clean and convert numeric values
-            qty_wo = clean_numeric(ws_wo.iloc[i, 3])
-            rate = clean_numeric(ws_wo.iloc[i, 4])
-            amount = clean_numeric(ws_wo.iloc[i, 5])
-            bsr = str(ws_wo.iloc[i, 6]) if pd.notnull(ws_wo.iloc[i, 6]) else ""
-
-            # Skip invalid rows
-            if not serial_no and not description and not unit:
-                continue
-            if qty_wo is None or rate is None or amount is None:
-                st.warning(f"Skipping Work Order row {i+2}: Invalid numeric value (qty={ws_wo.iloc[i, 3]}, rate={ws_wo.iloc[i, 4]}, amount={ws_wo.iloc[i, 5]})")
-                continue
+        # Ingest Work Order and Bill sheets column-wise, unless already done
+        if ingested is None:
+            ingested = ingest_workbook(ws_wo, ws_bq, ws_extra)
+        wo_items = ingested["wo_items"]
+        bill_items = ingested["bill_items"]
+        # Problems are collected in one report instead of a warning per row
+        report = data["validation"]
+        report.merge(ingested["wo_issues"])
+        report.merge(ingested["bill_issues"])
 
-            item = {
-                "serial_no": serial_no,
-                "description": description,
-                "unit": unit,
-                "qty_wo": qty_wo,
-                "rate": rate,
-                "amount": amount,
-                "bsr": bsr
-            }
-            wo_items.append(item)
-
-        # Process Bill items (start from row 21, 0-based index)
-        bill_items = []
-        for i in range(21, ws_bill.shape[0]):  # Changed from 20 to 21
-            serial_no = str(ws_bill.iloc[i, 0]) if pd.notnull(ws_bill.iloc[i, 0]) else ""
-            description = str(ws_bill.iloc[i, 1]) if pd.notnull(ws_bill.iloc[i, 1]) else ""
-            unit = str(ws_bill.iloc[i, 2]) if pd.notnull(ws_bill.iloc[i, 2]) else ""
-            
-            # Clean and convert numeric values
-            qty_bill = clean_numeric(ws_bill.iloc[i, 3])
-            rate = clean_numeric(ws_bill.iloc[i, 4])
-            amount = clean_numeric(ws_bill.iloc[i, 5])
-            bsr = str(ws_bill.iloc[i, 6]) if pd.notnull(ws_bill.iloc[i, 6]) else ""
-
-            # Skip invalid rows
-            if not serial_no and not description and not unit:
-                continue
-            if qty_bill is None or rate is None or amount is None:
-                st.warning(f"Skipping Bill Quantity row {i+2}: Invalid numeric value (qty={ws_bill.iloc[i, 3]}, rate={ws_bill.iloc[i, 4]}, amount={ws_bill.iloc[i, 5]})")
-                continue
+        # Join Work Order and Bill items on BSR for both tables
+        items, join_report = join_items_by_bsr(wo_items, bill_items, previous_items)
+        for sheet, item, count in join_report["duplicates"]:
+            report.add(sheet, item["row"], "G (bsr)", item["bsr"], f"BSR code is on {count} lines; the first Bill Quantity line is used")
+        for bill_item in join_report["unmatched"]:
+            report.add("Bill Quantity", bill_item["row"], "G (bsr)", bill_item["bsr"], "BSR code matches no Work Order item; the line is not billed")
 
-            item = {
-                "serial_no": serial_no,
-                "description": description,
-                "unit": unit,
-                "qty_bill": qty_bill,
-                "rate": rate,
-                "amount": amount,
-                "bsr": bsr
-            }
-            bill_items.append(item)
-
-        # Create data for First Page table
-        for wo_item in wo_items:
-            bill_item = next((bi for bi in bill_items if bi["bsr"] == wo_item["bsr"]), None)
-            qty_bill = bill_item["qty_bill"] if bill_item else 0
-            amount_bill = bill_item["amount"] if bill_item else 0
-            item = {
-                "unit": wo_item["unit"],
-                "qty_since_last": qty_bill,  # Assuming first bill
-                "qty_upto_date": qty_bill,
-                "serial_no": wo_item["serial_no"],
-                "description": wo_item["description"],
-                "rate": wo_item["rate"],
-                "amount_upto_date": amount_bill,
-                "amount_since_prev": amount_bill,
-                "remarks": ""
-            }
-            data["items"].append(item)
-
-        # Create deviation_data for Deviation Statement table
-        for wo_item in wo_items:
-            bill_item = next((bi for bi in bill_items if bi["bsr"] == wo_item["bsr"]), None)
-            qty_wo = wo_item["qty_wo"]
-            rate = wo_item["rate"]
-            amt_wo = wo_item["amount"]
-            qty_bill = bill_item["qty_bill"] if bill_item else 0
-            amt_bill = bill_item["amount"] if bill_item else 0
-            excess_qty = max(0, qty_bill - qty_wo)
-            excess_amt = excess_qty * rate
-            saving_qty = max(0, qty_wo - qty_bill)
-            saving_amt = saving_qty * rate
-            item = {
-                "serial_no": wo_item["serial_no"],
-                "description": wo_item["description"],
-                "unit": wo_item["unit"],
-                "qty_wo": qty_wo,
-                "rate": rate,
-                "amt_wo": amt_wo,
-                "qty_bill": qty_bill,
-                "amt_bill": amt_bill,
-                "excess_qty": excess_qty,
-                "excess_amt": excess_amt,
-                "saving_qty": saving_qty,
-                "saving_amt": saving_amt,
-                "remark": ""
-            }
-            deviation_data["items"].append(item)
-
-        # Handle Extra Items
-        if ws_extra is not None:
-            for i in range(ws_extra.shape[0]):
-                if pd.isna(ws_extra.iloc[i, 0]) or ws_extra.iloc[i, 0] == "":
-                    continue
-                serial_no = str(ws_extra.iloc[i, 0]) if pd.notnull(ws_extra.iloc[i, 0]) else ""
-                description = str(ws_extra.iloc[i, 2]) if pd.notnull(ws_extra.iloc[i, 2]) else ""
-                unit = str(ws_extra.iloc[i, 3]) if pd.notnull(ws_extra.iloc[i, 3]) else ""
-                
-                qty_bill = clean_numeric(ws_extra.iloc[i, 4])
-                rate = clean_numeric(ws_extra.iloc[i, 5])
-                amt_bill = clean_numeric(ws_extra.iloc[i, 6])
-                
-                if qty_bill is None or rate is None or amt_bill is None:
-                    st.warning(f"Skipping Extra Items row {i+2}: Invalid numeric value (qty={ws_extra.iloc[i, 4]}, rate={ws_extra.iloc[i, 5]}, amount={ws_extra.iloc[i, 6]})")
-                    continue
-                
-                item = {
-                    "serial_no": serial_no,
-                    "description": description,
-                    "unit": unit,
+        # Handle Extra Items: appended to the Deviation Statement rows
+        work_order_count = len(items)
+        if ingested["extra_items"] is not None:
+            report.merge(ingested["extra_issues"])
+            items = items.concat(ItemTable.from_records([
+                {
+                    "serial_no": extra_item["serial_no"],
+                    "description": extra_item["description"],
+                    "unit": extra_item["unit"],
+                    "bsr": "",
+                    "remark": "",
                     "qty_wo": 0,  # Extra items not in Work Order
-                    "rate": rate,
+                    "rate": extra_item["rate"],
                     "amt_wo": 0,
-                    "qty_bill": qty_bill,
-                    "amt_bill": amt_bill,
-                    "excess_qty": qty_bill,
-                    "excess_amt": amt_bill,
-                    "saving_qty": 0,
-                    "saving_amt": 0,
-                    "remark": ""
+                    "qty_bill": extra_item["qty_bill"],
+                    "amt_bill": extra_item["amount"],
+                    "qty_since_last": extra_item["qty_bill"],
+                    "amount_since_prev": extra_item["amount"]
                 }
-                deviation_data["items"].append(item)
+                for extra_item in ingested["extra_items"]
+            ]))
 
+        # Excess and saving of every item and all the bill's totals, in one pass over the columns
+        deviation_data["summary"] = compute_bill_totals(items, work_order_count, premium_percent, premium_type)
+
+        # The three tables share the item columns
+        data["items"] = items.view(FIRST_PAGE_FIELDS, 0, work_order_count)
+        data["extra_items"] = items.view(DEVIATION_FIELDS, work_order_count)
+        deviation_data["items"] = items.view(DEVIATION_FIELDS)
         return data, deviation_data, header_data
 
     except Exception as e:
-        st.error(f"Error processing bill: {str(e)}")
+        notify("error", f"Error processing bill: {str(e)}")
         raise
 
-def generate_bill_notes(payable_amount, work_order_amount, extra_item_amount):
+def generate_bill_notes(totals, work_order_amount):
+    """Note Sheet notes from the bill's totals (compute_bill_totals)."""
+    payable_amount = totals["grand_total_h"]
+    extra_item_amount = totals["extra_items_total"]
     percentage_work_done = float(payable_amount / work_order_amount * 100) if work_order_amount > 0 else 0
     serial_number = 1
     note = []
@@ -307,109 +1083,940 @@ def generate_bill_notes(payable_amount, work_order_amount, extra_item_amount):
         }
     }
 
-def generate_pdf(sheet_name, data, orientation, output_path):
+def log_event(event, level=logging.INFO, **fields):
+    """Emit a structured log line: a JSON object with the event name and fields."""
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event, **fields}, default=str))
+
+def rss_mb():
+    """
+    Resident memory of this process now, in MB. None where /proc is not
+    available (macOS, Windows).
+    """
     try:
-        required_fields = {
-            "First Page": ["header", "items", "totals"],
-            "Last Page": ["payable_amount", "amount_words"],
-            "Deviation Statement": ["items", "summary", "header"],
-            "Extra Items": ["items"],
-            "Note Sheet": [
-                "agreement_no", "name_of_work", "name_of_firm",
-                "date_commencement", "date_completion", "actual_completion",
-                "work_order_amount", "extra_item_amount", "notes", "totals"
-            ],
-            "Certificate III": [
-                "payable_amount", "total_123", "balance_4_minus_5",
-                "amount_paid_last_bill", "payment_now", "by_cheque",
-                "cheque_amount_words", "certificate_items",
-                "total_recovery", "totals"
-            ]
-        }
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
 
-        required = required_fields.get(sheet_name, [])
-        for field in required:
-            if field not in data:
-                raise ValueError(f"Missing required field for {sheet_name}: {field}")
+def converter_max_rss_mb():
+    """
+    Peak resident memory in MB of the largest child process (converter)
+    finished since the process started; it is not reset between bills. None
+    where the resource module is unavailable (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+class MemoryPeaks:
+    """
+    Peak resident memory over intervals that may overlap: nested spans, and
+    bills running at once. ru_maxrss only gives the peak of the whole process
+    lifetime, so while any interval is open a background thread samples the
+    resident memory every MEMORY_SAMPLE_SECONDS and raises the peak of every
+    open interval. A spike shorter than the sampling period can be missed,
+    and other threads' memory counts too. Peaks are None where /proc is not
+    available.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._open = {}
+        self._lock = threading.Lock()
+        self._opened = threading.Condition(self._lock)
+        self._sampler = None
+
+    def _record(self, value):
+        for token, peak in list(self._open.items()):
+            self._open[token] = max(peak, value)
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                while not self._open:
+                    self._opened.wait()
+            value = rss_mb()
+            with self._lock:
+                self._record(value)
+            time.sleep(self.interval)
+
+    def start(self):
+        """Open an interval. Returns its token for peak_mb(), or None where memory cannot be sampled."""
+        value = rss_mb()
+        if value is None:
+            return None
+        token = object()
+        with self._lock:
+            self._open[token] = value
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="bill-memory", daemon=True)
+                self._sampler.start()
+            self._opened.notify()
+        return token
+
+    def peak_mb(self, token, stop=False):
+        """Highest resident memory in MB sampled in an interval so far; stop=True closes it."""
+        if token is None:
+            return None
+        value = rss_mb()
+        with self._lock:
+            self._record(value)
+            return self._open.pop(token) if stop else self._open[token]
 
-        if "totals" in required and "totals" in data:
-            required_totals = {
-                "First Page": ["grand_total", "premium", "payable"],
-                "Certificate III": ["grand_total", "payable_amount", "extra_items_sum", "total_123"]
+@process_resource
+def memory_peaks():
+    """The MemoryPeaks of this process, shared by every bill run and span."""
+    return MemoryPeaks(MEMORY_SAMPLE_SECONDS)
+
+class BillTimings:
+    """
+    Timing spans of one bill run, each with the peak resident memory of the
+    process while it ran (MemoryPeaks; the converter processes are not
+    included). Spans are recorded from the render worker threads as well, so
+    appends are locked. finish() ends the run's own measurement.
+    """
+
+    def __init__(self, label=""):
+        self.label = label
+        self.run_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        self.spans = []
+        self.profile_path = None
+        self._start = time.perf_counter()
+        self._seconds = None
+        self._peak_rss_mb = None
+        self._memory = memory_peaks().start()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """
+        Time the block as `stage`. Yields the span's fields, which the block
+        may add to (sizes, counts) before the span is recorded.
+        """
+        start = time.perf_counter()
+        memory = memory_peaks().start()
+        try:
+            yield fields
+        finally:
+            record = {
+                "stage": stage,
+                **fields,
+                "seconds": round(time.perf_counter() - start, 4),
+                "peak_rss_mb": memory_peaks().peak_mb(memory, stop=True)
             }
-            required = required_totals.get(sheet_name, [])
-            for field in required:
-                if field not in data["totals"]:
-                    raise ValueError(f"Missing required totals field for {sheet_name}: {field}")
+            with self._lock:
+                self.spans.append(record)
+            log_event("span", level=logging.DEBUG, run_id=self.run_id, **record)
+
+    def finish(self):
+        """End the run: fix its duration and peak memory."""
+        if self._seconds is None:
+            self._seconds = round(time.perf_counter() - self._start, 4)
+            self._peak_rss_mb = memory_peaks().peak_mb(self._memory, stop=True)
 
-        template = env.get_template(f"{sheet_name.lower().replace(' ', '_')}.html")
-        html_content = template.render(data=data)
+    def summary(self):
+        finished = self._seconds is not None
+        return {
+            "run_id": self.run_id,
+            "label": self.label,
+            "seconds": self._seconds if finished else round(time.perf_counter() - self._start, 4),
+            "peak_rss_mb": self._peak_rss_mb if finished else memory_peaks().peak_mb(self._memory),
+            "converter_max_rss_mb": converter_max_rss_mb(),
+            # Process-wide counts; each render's pdf_cache span has its own cache_hit
+            "pdf_cache": pdf_cache().stats(),
+            "profile": self.profile_path,
+            "spans": list(self.spans)
+        }
+
+# BillTimings of the run in progress; run_render_jobs copies it into the workers
+CURRENT_TIMINGS = contextvars.ContextVar("bill_timings", default=None)
+# BillJob of a bill running in the background job queue, None when the bill
+# runs in the script thread (or the CLI)
+CURRENT_JOB = contextvars.ContextVar("bill_job", default=None)
+
+def notify(level, message):
+    """
+    Show a message in the page, or keep it on the current job when the bill
+    runs in the job queue, where there is no page to write to.
+    Args:
+        level: Name of the Streamlit element: "info", "warning", "error" or
+            "write".
+    """
+    job = CURRENT_JOB.get()
+    if job is None:
+        getattr(st, level)(message)
+    else:
+        job.messages.append((level, message))
 
-        debug_html_path = os.path.join(TEMP_DIR, f"{sheet_name.replace(' ', '_')}_debug.html")
+def notify_issues(report):
+    """
+    Surface a bill's validation report with a single warning: the report
+    is kept on the current job for show_bill_job, or shown in the page.
+    """
+    if not report.total:
+        return
+    log_event("validation_report", level=logging.WARNING, issues=report.total, kept=len(report.issues))
+    notify("warning", f"{report.total} problem(s) found in the workbook; see the validation report.")
+    job = CURRENT_JOB.get()
+    if job is None:
+        show_validation_report(report)
+    else:
+        job.report = report
+
+def show_validation_report(report, key="validation"):
+    """Show a validation report as one paginated table, with a CSV download."""
+    if report is None or not report.total:
+        return
+    frame = report.to_frame()
+    with st.expander(f"Validation report: {report.total} problem(s)", expanded=False):
+        if report.dropped:
+            st.caption(f"The first {len(report.issues)} are kept; {report.dropped} more were counted but not kept "
+                       f"(BILL_MAX_ISSUES).")
+        pages = -(-len(frame) // ISSUE_PAGE_ROWS)
+        page = st.number_input("Page", min_value=1, max_value=pages, value=1, key=f"{key}_page") if pages > 1 else 1
+        start = (page - 1) * ISSUE_PAGE_ROWS
+        st.dataframe(frame.iloc[start:start + ISSUE_PAGE_ROWS], use_container_width=True, hide_index=True)
+        st.download_button(
+            label="Download validation report (CSV)",
+            data=report.to_csv(),
+            file_name="validation_report.csv",
+            mime="text/csv",
+            key=f"{key}_csv"
+        )
+
+@contextmanager
+def timed(stage, **fields):
+    """
+    Record a span on the current bill run, if one is being instrumented, and
+    move a queued bill's progress to the stage.
+    Yields the span's fields dict (a throwaway one when not instrumented).
+    """
+    job = CURRENT_JOB.get()
+    if job is not None:
+        job.enter_stage(stage)
+    timings = CURRENT_TIMINGS.get()
+    if timings is None:
+        yield fields
+        return
+    with timings.span(stage, **fields) as span_fields:
+        yield span_fields
+
+@contextmanager
+def profiled(run_id):
+    """
+    Profile the block with the profiler named by BILL_PROFILE.
+    Yields:
+        Path the profile is written to when the block ends, or None when
+        profiling is disabled.
+    """
+    if not PROFILER:
+        yield None
+        return
+    if PROFILER not in ("cprofile", "pyinstrument"):
+        raise ValueError(f"Unknown BILL_PROFILE {PROFILER!r}; use cprofile or pyinstrument")
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    if PROFILER == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("BILL_PROFILE=pyinstrument needs the pyinstrument package")
+        profile_path = os.path.join(PROFILE_DIR, f"bill_{run_id}.html")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield profile_path
+        finally:
+            profiler.stop()
+            with open(profile_path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+    else:
+        # cProfile only sees the calling thread; converter waits in the render
+        # pool show up as time spent in run_render_jobs
+        profile_path = os.path.join(PROFILE_DIR, f"bill_{run_id}.prof")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profile_path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+
+@contextmanager
+def instrumented_run(label=""):
+    """
+    Instrument one bill run: collect timing spans, profile it if BILL_PROFILE
+    is set, and log the run summary as a JSON line when it ends.
+    Yields:
+        The run's BillTimings.
+    """
+    timings = BillTimings(label)
+    token = CURRENT_TIMINGS.set(timings)
+    try:
+        with profiled(timings.run_id) as profile_path:
+            timings.profile_path = profile_path
+            yield timings
+    finally:
+        CURRENT_TIMINGS.reset(token)
+        timings.finish()
+        log_event("bill_run", **timings.summary())
+
+def show_timings(timings):
+    """Show the spans and memory of a bill run in a collapsed expander."""
+    summary = timings.summary()
+    with st.expander("Performance details", expanded=False):
+        st.write(f"Total {summary['seconds']:.2f}s, peak memory {summary['peak_rss_mb']} MB "
+                 f"(largest converter so far {summary['converter_max_rss_mb']} MB)")
+        st.dataframe(pd.DataFrame(summary["spans"]), use_container_width=True)
+        st.caption(f"PDF cache since start: {summary['pdf_cache']['hits']} hit(s), "
+                   f"{summary['pdf_cache']['misses']} miss(es)")
+        if summary["profile"]:
+            st.caption(f"Profile written to {summary['profile']}")
+
+class PdfRenderCache:
+    """
+    On-disk cache of rendered PDFs with size-bounded LRU eviction.
+    Entries are keyed by a hash of the rendered HTML and the pdfkit options.
+    The HTML already reflects both the template source and the sheet data,
+    so editing either one misses the cache. A hit touches the file's mtime,
+    so the least recently used files are evicted first.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(template_names, html_pages, options):
+        digest = hashlib.sha256()
+        for template_name, html_content in zip(template_names, html_pages):
+            digest.update(template_name.encode("utf-8") + b"\0")
+            digest.update(html_content.encode("utf-8") + b"\0")
+        digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get(self, key):
+        """Cached PDF bytes, or None on a miss, including an unreadable entry."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                pdf_bytes = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return pdf_bytes
+
+    def put(self, key, pdf_bytes):
+        """
+        Store a rendered PDF. A failed write (full disk, read-only directory)
+        raises OSError and leaves no partial file behind.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, partial_path = tempfile.mkstemp(dir=self.directory, suffix=".partial")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf_bytes)
+            os.replace(partial_path, self._path(key))
+        except OSError:
+            try:
+                os.remove(partial_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used PDFs until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".pdf"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        # Evicted by another process sharing the directory
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+@process_resource
+def pdf_cache():
+    """The PDF cache shared by every session, bill job and render thread, with its hit and miss counts."""
+    return PdfRenderCache(PDF_CACHE_DIR, PDF_CACHE_MAX_MB * 1024 * 1024)
+
+def cached_pdf(key, sheet):
+    """Look a render up in the PDF cache, as a pdf_cache span recording whether it hit. None on a miss."""
+    cache = pdf_cache()
+    if not cache.enabled:
+        return None
+    with timed("pdf_cache", sheet=sheet) as span:
+        pdf_bytes = cache.get(key)
+        span["cache_hit"] = pdf_bytes is not None
+    return pdf_bytes
+
+def cache_pdf(key, pdf_bytes):
+    """Keep a rendered PDF in the cache; the cache is best-effort, so a failed write is only logged."""
+    cache = pdf_cache()
+    if not cache.enabled:
+        return
+    try:
+        cache.put(key, pdf_bytes)
+    except OSError as e:
+        log_event("pdf_cache_write_failed", level=logging.WARNING, error=str(e))
+
+def validate_sheet_data(sheet_name, data):
+    """Raise ValueError if a sheet's data lacks a field its template needs."""
+    required_fields = {
+        "First Page": ["header", "items", "totals"],
+        "Last Page": ["payable_amount", "amount_words"],
+        "Deviation Statement": ["items", "summary", "header"],
+        "Extra Items": ["items"],
+        "Note Sheet": [
+            "agreement_no", "name_of_work", "name_of_firm",
+            "date_commencement", "date_completion", "actual_completion",
+            "work_order_amount", "extra_item_amount", "notes", "totals"
+        ],
+        "Certificate III": [
+            "payable_amount", "total_123", "balance_4_minus_5",
+            "amount_paid_last_bill", "payment_now", "by_cheque",
+            "cheque_amount_words", "certificate_items",
+            "total_recovery", "totals"
+        ]
+    }
+
+    required = required_fields.get(sheet_name, [])
+    for field in required:
+        if field not in data:
+            raise ValueError(f"Missing required field for {sheet_name}: {field}")
+
+    if "totals" in required and "totals" in data:
+        required_totals = {
+            "First Page": ["grand_total", "premium", "payable"],
+            "Certificate III": ["grand_total", "payable_amount", "extra_items_sum", "total_123"]
+        }
+        required = required_totals.get(sheet_name, [])
+        for field in required:
+            if field not in data["totals"]:
+                raise ValueError(f"Missing required totals field for {sheet_name}: {field}")
+
+def render_sheet_html(sheet_name, data):
+    """Validate a sheet's data and render its template, saving a debug copy if enabled."""
+    validate_sheet_data(sheet_name, data)
+    template = get_template_env().get_template(f"{sheet_name.lower().replace(' ', '_')}.html")
+    html_content = template.render(data=data)
+
+    if DEBUG_HTML_DIR:
+        os.makedirs(DEBUG_HTML_DIR, exist_ok=True)
+        debug_html_path = os.path.join(DEBUG_HTML_DIR, f"{sheet_name.replace(' ', '_')}_debug.html")
         with open(debug_html_path, "w", encoding="utf-8") as f:
             f.write(html_content)
+    return html_content
 
-        options = {
-            "page-size": "A4",
-            "orientation": orientation,
-            "margin-top": "0.25in",
-            "margin-bottom": "0.25in",
-            "margin-left": "0.25in",
-            "margin-right": "0.5in",
-            "encoding": "UTF-8",
-            "quiet": "",
-            "no-outline": None,
-            "enable-local-file-access": None,
-            "disable-smart-shrinking": None,
-            "dpi": 300,
-            "javascript-delay": "1000",
-            "no-stop-slow-scripts": None,
-            "load-error-handling": "ignore"
-        }
+def pdf_options(sheet_name, orientation):
+    """wkhtmltopdf options for a sheet, given by display or template name."""
+    options = {
+        "page-size": "A4",
+        "orientation": orientation,
+        "margin-top": "0.25in",
+        "margin-bottom": "0.25in",
+        "margin-left": "0.25in",
+        "margin-right": "0.5in",
+        "encoding": "UTF-8",
+        "quiet": "",
+        "no-outline": None,
+        "enable-local-file-access": None,
+        "disable-smart-shrinking": None,
+        "dpi": 300,
+        "javascript-delay": "1000",
+        "no-stop-slow-scripts": None,
+        "load-error-handling": "ignore"
+    }
+
+    sheet_key = sheet_name.lower().replace(' ', '_')
+    if sheet_key == "note_sheet":
+        options["margin-bottom"] = "0.6in"
+    elif sheet_key == "deviation_statement":
+        options["margin-bottom"] = "0.25in"
+    return options
 
-        if sheet_name == "Note Sheet":
-            options["margin-bottom"] = "0.6in"
-        elif sheet_name == "Deviation Statement":
-            options["margin-bottom"] = "0.25in"
+def write_pdf_output(pdf_bytes, output_path):
+    """Write PDF bytes to `output_path` and return True, or return the bytes if there is no path."""
+    if output_path is None:
+        return pdf_bytes
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.write(pdf_bytes)
+    return True
 
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        pdfkit.from_string(html_content, output_path, configuration=config, options=options)
+@process_resource
+def converter_slots():
+    """Semaphore shared by every session and bill job, bounding concurrent wkhtmltopdf processes."""
+    return threading.BoundedSemaphore(max(1, CONVERTER_SLOTS))
 
-        if not os.path.exists(output_path):
-            raise Exception(f"PDF file was not created at {output_path}")
+@contextmanager
+def converter_slot(sheet_name):
+    """Hold one of the BILL_CONVERTER_SLOTS for a wkhtmltopdf run; the wait is its own span."""
+    slots = converter_slots()
+    with timed("converter_wait", sheet=sheet_name):
+        slots.acquire()
+    try:
+        yield
+    finally:
+        slots.release()
+
+class WkhtmltopdfBackend:
+    """Render a sheet from its HTML template with wkhtmltopdf, through the PDF cache."""
+    name = "wkhtmltopdf"
 
+    def supports(self, sheet_name):
         return True
 
+    def render(self, sheet_name, data, orientation):
+        with timed("render_html", sheet=sheet_name):
+            html_content = render_sheet_html(sheet_name, data)
+        options = pdf_options(sheet_name, orientation)
+
+        cache_key = PdfRenderCache.key([sheet_name], [html_content], options)
+        pdf_bytes = cached_pdf(cache_key, sheet_name)
+        if pdf_bytes is None:
+            import pdfkit
+            with converter_slot(sheet_name), timed("wkhtmltopdf", sheet=sheet_name):
+                pdf_bytes = pdfkit.from_string(html_content, False, configuration=get_pdfkit_config(), options=options)
+            if not pdf_bytes:
+                raise Exception(f"wkhtmltopdf produced no output for {sheet_name}")
+            cache_pdf(cache_key, pdf_bytes)
+        return pdf_bytes
+
+class DirectPdfBackend:
+    """
+    Draw the table sheets straight to PDF with fpdf2, in process: no HTML
+    layout and no converter subprocess. Other sheets are left to wkhtmltopdf.
+    """
+    name = "direct"
+
+    @staticmethod
+    def drawing():
+        try:
+            import pdf_direct
+        except ImportError as e:
+            raise ImportError(f"BILL_PDF_BACKEND=direct needs the fpdf2 package ({e})")
+        return pdf_direct
+
+    def supports(self, sheet_name):
+        return sheet_name in self.drawing().SHEET_DRAWERS
+
+    def render(self, sheet_name, data, orientation):
+        validate_sheet_data(sheet_name, data)
+        with timed("draw_pdf", sheet=sheet_name):
+            return self.drawing().draw_sheet(sheet_name, data, orientation)
+
+PDF_BACKENDS = {"wkhtmltopdf": WkhtmltopdfBackend(), "direct": DirectPdfBackend()}
+
+def pdf_backend_for(sheet_name, backend=PDF_BACKEND):
+    """The backend that renders a sheet: the configured one if it supports the sheet, otherwise wkhtmltopdf."""
+    if backend not in PDF_BACKENDS:
+        raise ValueError(f"Unknown BILL_PDF_BACKEND {backend!r}; use one of: {', '.join(PDF_BACKENDS)}")
+    selected = PDF_BACKENDS[backend]
+    return selected if selected.supports(sheet_name) else PDF_BACKENDS["wkhtmltopdf"]
+
+def generate_pdf(sheet_name, data, orientation, output_path=None):
+    try:
+        pdf_bytes = pdf_backend_for(sheet_name).render(sheet_name, data, orientation)
+        return write_pdf_output(pdf_bytes, output_path)
+
     except Exception as e:
-        st.error(f"Error generating PDF for {sheet_name}: {str(e)}")
-        st.write(traceback.format_exc())
+        notify("error", f"Error generating PDF for {sheet_name}: {str(e)}")
+        notify("write", traceback.format_exc())
         raise
 
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.section import WD_ORIENT
-from docx.oxml.ns import qn
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-import streamlit as st
-import traceback
+def generate_batch_pdf(sheets, options, output_path=None):
+    """
+    Render several sheets sharing the same converter options with a single
+    wkhtmltopdf invocation.
+    Every sheet is passed as its own page object, so each keeps its own
+    stylesheet and starts on a new page. The page files live in a temporary
+    directory removed after the call.
+    Args:
+        sheets: List of (sheet_name, data) tuples, in output order.
+        options: wkhtmltopdf options shared by all sheets.
+        output_path: Path of the combined PDF, or None to return its bytes.
+    """
+    sheet_names = ", ".join(sheet_name for sheet_name, _ in sheets)
+    backend = pdf_backend_for(sheets[0][0])
+    if backend.name != "wkhtmltopdf":
+        # render_parts never groups sheets drawn in process
+        (sheet_name, data), = sheets
+        return generate_pdf(sheet_name, data, options["orientation"], output_path)
+    try:
+        html_pages = []
+        for sheet_name, data in sheets:
+            with timed("render_html", sheet=sheet_name):
+                html_pages.append(render_sheet_html(sheet_name, data))
+        cache_key = PdfRenderCache.key([sheet_name for sheet_name, _ in sheets], html_pages, options)
+        pdf_bytes = cached_pdf(cache_key, sheet_names)
+        if pdf_bytes is None:
+            with tempfile.TemporaryDirectory(prefix="bill_pages_") as page_dir:
+                html_paths = []
+                for (sheet_name, _), html_content in zip(sheets, html_pages):
+                    html_path = os.path.join(page_dir, f"{sheet_name.replace(' ', '_')}.html")
+                    with open(html_path, "w", encoding="utf-8") as f:
+                        f.write(html_content)
+                    html_paths.append(html_path)
+                import pdfkit
+                with converter_slot(sheet_names), timed("wkhtmltopdf", sheet=sheet_names):
+                    pdf_bytes = pdfkit.from_file(html_paths, False, configuration=get_pdfkit_config(), options=options)
+            if not pdf_bytes:
+                raise Exception(f"wkhtmltopdf produced no output for {sheet_names}")
+            cache_pdf(cache_key, pdf_bytes)
 
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.section import WD_ORIENT
-from docx.oxml.ns import qn
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-import streamlit as st
-import traceback
+        return write_pdf_output(pdf_bytes, output_path)
 
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.section import WD_ORIENT
-from docx.oxml.ns import qn
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-import streamlit as st
-import traceback
+    except Exception as e:
+        notify("error", f"Error generating PDF for {sheet_names}: {str(e)}")
+        notify("write", traceback.format_exc())
+        raise
+
+def render_pool(max_workers, job_count):
+    """Thread pool for render jobs, with workers that can write to the page."""
+    ctx = get_script_run_ctx()
+
+    def attach_context():
+        # Let the render function report its own errors in the page from worker threads
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+    return ThreadPoolExecutor(max_workers=max(1, min(max_workers, job_count)), initializer=attach_context)
 
-def create_word_doc(data, deviation_data, header_data, sheet_name=""):
+def submit_render_jobs(pool, render, jobs):
+    """
+    Submit render jobs to a render_pool, each in its own copy of the context
+    so spans land on the current run. A queued bill's progress advances as
+    jobs finish.
+    Returns:
+        The futures, in job order.
+    """
+    futures = [pool.submit(contextvars.copy_context().run, render, *job) for job in jobs]
+    bill_job = CURRENT_JOB.get()
+    if bill_job is not None:
+        rendered = iter(range(1, len(jobs) + 1))
+        for future in futures:
+            future.add_done_callback(lambda _: bill_job.stage_step(next(rendered), len(jobs)))
+    return futures
+
+def run_render_jobs(render, jobs, labels, max_workers=PDF_WORKERS):
+    """
+    Run PDF render jobs concurrently.
+    Each wkhtmltopdf call runs in its own subprocess, so a small thread pool
+    brings the wall-clock time down to roughly the slowest job.
+    Args:
+        render: generate_pdf or generate_batch_pdf.
+        jobs: Argument tuples for `render`, the last item being the output path
+            or None.
+        labels: Sheet names used to report failures, one per job.
+        max_workers: Upper bound on concurrent converter processes.
+    Returns:
+        For each job in order, its output path, or the PDF bytes if it had none.
+    Raises:
+        RuntimeError: Naming every job that failed, after all jobs finished.
+    """
+    with render_pool(max_workers, len(jobs)) as pool:
+        futures = submit_render_jobs(pool, render, jobs)
+
+    pdf_files = []
+    failures = []
+    for job, label, future in zip(jobs, labels, futures):
+        error = future.exception()
+        if error is not None:
+            failures.append(f"{label} ({error})")
+        elif job[-1] is None:
+            pdf_files.append(future.result())
+        elif future.result():
+            pdf_files.append(job[-1])
+    if failures:
+        raise RuntimeError(f"PDF generation failed for: {'; '.join(failures)}")
+    return pdf_files
+
+def render_sheets(jobs, max_workers=PDF_WORKERS):
+    """
+    Render each sheet to its own PDF, concurrently.
+    Args:
+        jobs: List of (sheet_name, data, orientation, output_path) tuples,
+            output_path being None to keep the PDF in memory.
+    Returns:
+        Output paths or PDF bytes, in job order.
+    """
+    return run_render_jobs(generate_pdf, jobs, [job[0] for job in jobs], max_workers)
+
+def render_batched(parts, max_workers=PDF_WORKERS):
+    """
+    Render each part from render_parts, a run of consecutive sheets sharing
+    converter options, with one wkhtmltopdf invocation, keeping the original
+    sheet order.
+    Args:
+        parts: Lists of (sheet_name, data, orientation, output_path) tuples,
+            output_path being None to keep the PDF in memory.
+    Returns:
+        Output paths or PDF bytes of the parts, in sheet order.
+    """
+    batches = []
+    for part in parts:
+        sheet_name, _, orientation, output_path = part[0]
+        batch_path = f"{os.path.splitext(output_path)[0]}_batch.pdf" if output_path else None
+        batches.append(([(job[0], job[1]) for job in part], pdf_options(sheet_name, orientation), batch_path))
+    labels = [", ".join(sheet_name for sheet_name, _ in sheets) for sheets, _, _ in batches]
+    return run_render_jobs(generate_batch_pdf, batches, labels, max_workers)
+
+# Sheets whose item table chunked mode splits, with the amount columns whose
+# running totals are carried from one segment to the next
+CHUNKED_SHEETS = {
+    "First Page": ("amount_upto_date", "amount_since_prev"),
+    "Deviation Statement": ("amt_wo", "amt_bill", "excess_amt", "saving_amt")
+}
+
+def sheet_segments(sheet_name, data, rows=CHUNK_ROWS):
+    """
+    Split a sheet's item table into segments of `rows` items for chunked
+    rendering. Each segment is the sheet's data with its slice of the items
+    and a "segment" entry: its number, whether it is the first (the template
+    draws the header) or the last (the totals), and the running totals
+    brought forward from the earlier segments and carried forward past this
+    one.
+    Sheets without an item table, sheets drawn in process and tables of at
+    most `rows` items come back whole, as a single segment without a
+    "segment" entry.
+    """
+    items = data.get("items") or []
+    if (sheet_name not in CHUNKED_SHEETS or rows <= 0 or len(items) <= rows
+            or pdf_backend_for(sheet_name).name != "wkhtmltopdf"):
+        return [data]
+
+    columns = CHUNKED_SHEETS[sheet_name]
+    count = -(-len(items) // rows)
+    running = dict.fromkeys(columns, 0.0)
+    segments = []
+    for number, start in enumerate(range(0, len(items), rows), 1):
+        chunk = items[start:start + rows]
+        brought_forward = {column: round(total, 2) for column, total in running.items()}
+        for column in columns:
+            running[column] += float(chunk.column(column).sum())
+        segments.append({
+            **data,
+            "items": chunk,
+            "segment": {
+                "number": number,
+                "count": count,
+                "first": number == 1,
+                "last": number == count,
+                "brought_forward": brought_forward,
+                "carried_forward": {column: round(total, 2) for column, total in running.items()}
+            }
+        })
+    return segments
+
+def render_chunked(jobs, rows=CHUNK_ROWS, max_workers=PDF_WORKERS):
+    """
+    Render sheets with long item tables split into segments (sheet_segments)
+    and merge each sheet's pieces in order as they finish.
+    Segments render concurrently, each its own converter run over at most
+    `rows` items, so the converter's memory no longer grows with the bill.
+    Every piece is written to a temporary file, appended to its sheet's
+    document as soon as it and the pieces before it are done, and deleted,
+    so the rendered PDFs are never all held at once.
+    Args:
+        jobs: List of (sheet_name, data, orientation, output_path) tuples;
+            the output paths are ignored.
+    Returns:
+        PDF bytes of each sheet, in job order.
+    Raises:
+        RuntimeError: Naming every piece that failed, after all finished.
+    """
+    from pypdf import PdfWriter
+    writers = [PdfWriter() for _ in jobs]
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="bill_segments_") as segment_dir:
+        pieces = []
+        labels = []
+        piece_writers = []
+        for writer, (sheet_name, data, orientation, _) in zip(writers, jobs):
+            for segment in sheet_segments(sheet_name, data, rows):
+                pieces.append((sheet_name, segment, orientation, os.path.join(segment_dir, f"{len(pieces):05d}.pdf")))
+                info = segment.get("segment")
+                labels.append(f"{sheet_name} segment {info['number']} of {info['count']}" if info else sheet_name)
+                piece_writers.append(writer)
+
+        with render_pool(max_workers, len(pieces)) as pool:
+            futures = submit_render_jobs(pool, generate_pdf, pieces)
+            for piece, label, writer, future in zip(pieces, labels, piece_writers, futures):
+                error = future.exception()
+                if error is not None:
+                    failures.append(f"{label} ({error})")
+                elif not failures:
+                    with timed("merge_segment", sheet=label):
+                        writer.append(piece[-1])
+                if os.path.exists(piece[-1]):
+                    os.remove(piece[-1])
+    if failures:
+        raise RuntimeError(f"PDF generation failed for: {'; '.join(failures)}")
+
+    pdfs = []
+    for writer in writers:
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        pdfs.append(buffer.getvalue())
+    return pdfs
+
+def render_parts(jobs, mode=RENDER_MODE):
+    """
+    Group render jobs into the parts `mode` renders to one PDF each: in
+    batched mode, runs of consecutive sheets that share converter options
+    (sheets the configured backend draws in process stay on their own);
+    otherwise every sheet on its own.
+    Returns:
+        Lists of jobs, in sheet order.
+    """
+    if mode != "batched":
+        return [[job] for job in jobs]
+    parts = []
+    previous_options = None
+    for job in jobs:
+        sheet_name, _, orientation, _ = job
+        options = pdf_options(sheet_name, orientation)
+        batchable = pdf_backend_for(sheet_name).name == "wkhtmltopdf"
+        if batchable and options == previous_options:
+            parts[-1].append(job)
+        else:
+            parts.append([job])
+        previous_options = options if batchable else None
+    return parts
+
+def render_pdfs(parts, mode=RENDER_MODE):
+    """
+    Render parts from render_parts with the per-sheet, batched or chunked
+    strategy.
+    Returns:
+        Output paths or PDF bytes of the parts, in sheet order.
+    """
+    if mode == "batched":
+        return render_batched(parts)
+    jobs = [job for job, in parts]
+    if mode == "chunked":
+        return render_chunked(jobs)
+    return render_sheets(jobs)
+
+# Rows parsed per parse_xml call when bulk-writing Word tables
+DOCX_ROW_BATCH = int(os.environ.get("BILL_DOCX_ROW_BATCH", "500"))
+# Table style carrying the deviation table font, so runs need no direct formatting
+DEVIATION_TABLE_STYLE = "Deviation Table"
+W_NAMESPACE = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+@process_resource
+def word_skeleton():
+    """
+    Build the empty Word document every bill starts from: A4 landscape page
+    setup and the deviation table style (Table Grid borders, Calibri 8pt).
+    Returns:
+        The skeleton document as .docx bytes.
+    """
+    from docx import Document
+    from docx.enum.section import WD_ORIENT
+    from docx.enum.style import WD_STYLE_TYPE
+    from docx.shared import Inches, Pt
+    doc = Document()
+    section = doc.sections[0]
+    section.orientation = WD_ORIENT.LANDSCAPE
+    section.page_width = Inches(11.69)
+    section.page_height = Inches(8.27)
+    section.left_margin = Inches(0.5512)
+    section.right_margin = Inches(0.5512)
+
+    style = doc.styles.add_style(DEVIATION_TABLE_STYLE, WD_STYLE_TYPE.TABLE)
+    style.base_style = doc.styles["Table Grid"]
+    style.font.name = "Calibri"
+    style.font.size = Pt(8)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def word_run_xml(value):
+    """Return the run XML for a cell value, with tabs and line breaks as Word elements."""
+    text = "" if value is None else str(value)
+    if not text:
+        return ""
+    text = escape(text).replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">')
+    text = re.sub(r"\r\n|\r|\n", '</w:t><w:br/><w:t xml:space="preserve">', text)
+    return f'<w:r><w:t xml:space="preserve">{text}</w:t></w:r>'
+
+def add_word_table(doc, column_widths, rows, style, autofit=True):
+    """
+    Append a table to the document, writing the row XML in batches of
+    DOCX_ROW_BATCH rows instead of assigning python-docx cells one by one.
+    Args:
+        doc: python-docx Document.
+        column_widths: Column widths in inches.
+        rows: Iterable of rows, each a list with one value per column.
+        style: Table style name.
+        autofit: Whether Word may resize the columns to fit their content.
+    Returns:
+        The python-docx Table.
+    """
+    from docx.oxml.parser import parse_xml
+    from docx.shared import Inches
+    table = doc.add_table(rows=0, cols=len(column_widths))
+    table.style = style
+    table.autofit = autofit
+    for grid_col, width in zip(table._tbl.tblGrid.gridCol_lst, column_widths):
+        grid_col.w = Inches(width)
+
+    cell_xml = [
+        f'<w:tc><w:tcPr><w:tcW w:w="{Inches(width).twips}" w:type="dxa"/></w:tcPr><w:p>{{}}</w:p></w:tc>'
+        for width in column_widths
+    ]
+    row_xml = (
+        "<w:tr>" + "".join(cell.format(word_run_xml(value)) for cell, value in zip(cell_xml, row)) + "</w:tr>"
+        for row in rows
+    )
+    while True:
+        batch = "".join(islice(row_xml, DOCX_ROW_BATCH))
+        if not batch:
+            break
+        table._tbl.extend(parse_xml(f"<w:tbl {W_NAMESPACE}>{batch}</w:tbl>"))
+    return table
+
+def create_word_doc(data, deviation_data, header_data, sheet_name="", output_path="output.docx"):
+    """Write the First Page and Deviation Statement tables to `output_path`, a path or binary stream."""
     try:
         # Validate input types
         if not isinstance(data, dict):
@@ -421,117 +2028,605 @@ def create_word_doc(data, deviation_data, header_data, sheet_name=""):
         if "items" not in deviation_data:
             raise KeyError("'deviation_data' dictionary missing 'items' key")
 
-        doc = Document()
-        
+        from docx import Document
+        doc = Document(io.BytesIO(word_skeleton()))
+
         # First Page table
-        section = doc.sections[0]
-        section.left_margin = Inches(0.25)
-        section.right_margin = Inches(0.5)
-        table = doc.add_table(rows=len(data["items"]) + 4, cols=9)
-        table.style = "Table Grid"
-        column_widths = [0.4, 0.55, 0.55, 0.38, 2.5, 0.52, 0.77, 0.6, 0.47]
-        for i, width in enumerate(column_widths):
-            for cell in table.columns[i].cells:
-                cell.width = Inches(width)
-        table.cell(0, 0).text = "Unit"
-        table.cell(0, 1).text = "Quantity executed (or supplied) since last certificate"
-        table.cell(0, 2).text = "Quantity executed (or supplied) upto date as per MB"
-        table.cell(0, 3).text = "S. No."
-        table.cell(0, 4).text = 'Item of Work supplies (Grouped under "sub-head" and "sub work" of estimate)'
-        table.cell(0, 5).text = "Rate"
-        table.cell(0, 6).text = "Upto date Amount"
-        table.cell(0, 7).text = "Amount Since previous bill (Total for each sub-head)"
-        table.cell(0, 8).text = "Remarks"
+        first_page_rows = [[
+            "Unit",
+            "Quantity executed (or supplied) since last certificate",
+            "Quantity executed (or supplied) upto date as per MB",
+            "S. No.",
+            'Item of Work supplies (Grouped under "sub-head" and "sub work" of estimate)',
+            "Rate",
+            "Upto date Amount",
+            "Amount Since previous bill (Total for each sub-head)",
+            "Remarks"
+        ]]
         # Populate First Page data (omitted for brevity)
-        
+        first_page_rows += [[""] * 9 for _ in range(len(data["items"]) + 3)]
+        add_word_table(doc, [0.4, 0.55, 0.55, 0.38, 2.5, 0.52, 0.77, 0.6, 0.47], first_page_rows, "Table Grid")
+
         # Deviation Statement table
-        section = doc.sections[-1]
-        section.orientation = WD_ORIENT.LANDSCAPE
-        section.page_width = Inches(11.69)
-        section.page_height = Inches(8.27)
-        section.left_margin = Inches(0.5512)
-        section.right_margin = Inches(0.5512)
-        
-        table = doc.add_table(rows=len(deviation_data["items"]) + 5, cols=13)
-        table.style = "Table Grid"
-        table.autofit = False
-        
-        column_widths = [0.353, 6.352, 0.353, 0.353, 0.353, 0.353, 0.353, 0.353, 0.353, 0.353, 0.353, 0.353, 0.795]
-        for i, width in enumerate(column_widths):
-            for cell in table.columns[i].cells:
-                cell.width = Inches(width)
-        
-        table.cell(0, 0).text = "ITEM No."
-        table.cell(0, 1).text = "Description"
-        table.cell(0, 2).text = "Unit"
-        table.cell(0, 3).text = "Qty as per Work Order"
-        table.cell(0, 4).text = "Rate"
-        table.cell(0, 5).text = "Amt as per Work Order Rs."
-        table.cell(0, 6).text = "Qty Executed"
-        table.cell(0, 7).text = "Amt as per Executed Rs."
-        table.cell(0, 8).text = "Excess Qty"
-        table.cell(0, 9).text = "Excess Amt Rs."
-        table.cell(0, 10).text = "Saving Qty"
-        table.cell(0, 11).text = "Saving Amt Rs."
-        table.cell(0, 12).text = "REMARKS/REASON."
-        
-        for i, item in enumerate(deviation_data["items"], 1):
-            row_cells = table.rows[i].cells
-            row_cells[0].text = str(item.get("serial_no", ""))
-            row_cells[1].text = item.get("description", "")
-            row_cells[2].text = item.get("unit", "")
-            row_cells[3].text = str(item.get("qty_wo", "")) if item.get("unit", "").strip() else ""
-            row_cells[4].text = str(item.get("rate", "")) if item.get("unit", "").strip() else ""
-            row_cells[5].text = str(item.get("amt_wo", "")) if item.get("unit", "").strip() and item.get("rate", "").strip() else ""
-            row_cells[6].text = str(item.get("qty_bill", "")) if item.get("unit", "").strip() else ""
-            row_cells[7].text = str(item.get("amt_bill", "")) if item.get("unit", "").strip() and item.get("rate", "").strip() else ""
-            row_cells[8].text = str(item.get("excess_qty", "")) if item.get("unit", "").strip() else ""
-            row_cells[9].text = str(item.get("excess_amt", "")) if item.get("unit", "").strip() and item.get("rate", "").strip() else ""
-            row_cells[10].text = str(item.get("saving_qty", "")) if item.get("unit", "").strip() else ""
-            row_cells[11].text = str(item.get("saving_amt", "")) if item.get("unit", "").strip() and item.get("rate", "").strip() else ""
-            row_cells[12].text = item.get("remark", "")
-        
-        summary_row = table.rows[-5].cells
-        summary_row[1].text = "Grand Total Rs."
-        summary_row[5].text = str(deviation_data["summary"].get("work_order_total", ""))
-        summary_row[7].text = str(deviation_data["summary"].get("executed_total", ""))
-        summary_row[9].text = str(deviation_data["summary"].get("overall_excess", ""))
-        summary_row[11].text = str(deviation_data["summary"].get("overall_saving", ""))
-        
-        premium_row = table.rows[-4].cells
-        premium_percent = deviation_data["summary"].get("premium", {}).get("percent", 0) * 100
-        premium_row[1].text = f"Add Tender Premium ({premium_percent:.2f}%)"
-        premium_row[5].text = str(deviation_data["summary"].get("tender_premium_f", ""))
-        premium_row[7].text = str(deviation_data["summary"].get("tender_premium_h", ""))
-        premium_row[9].text = str(deviation_data["summary"].get("tender_premium_j", ""))
-        premium_row[11].text = str(deviation_data["summary"].get("tender_premium_l", ""))
-        
-        grand_total_row = table.rows[-3].cells
-        grand_total_row[1].text = "Grand Total including Tender Premium Rs."
-        grand_total_row[5].text = str(deviation_data["summary"].get("grand_total_f", ""))
-        grand_total_row[7].text = str(deviation_data["summary"].get("grand_total_h", ""))
-        grand_total_row[9].text = str(deviation_data["summary"].get("grand_total_j", ""))
-        grand_total_row[11].text = str(deviation_data["summary"].get("grand_total_l", ""))
-        
-        net_diff_row = table.rows[-2].cells
-        net_diff = deviation_data["summary"].get("net_difference", 0)
-        net_diff_row[1].text = "Overall Excess With Respect to the Work Order Amount Rs." if net_diff > 0 else "Overall Saving With Respect to the Work Order Amount Rs."
-        net_diff_row[7].text = str(abs(net_diff))
-        
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    for run in paragraph.runs:
-                        run.font.name = "Calibri"
-                        run.font.size = Pt(8)
-        
-        doc.save("output.docx")
-    
+        deviation_rows = [[
+            "ITEM No.", "Description", "Unit", "Qty as per Work Order", "Rate", "Amt as per Work Order Rs.",
+            "Qty Executed", "Amt as per Executed Rs.", "Excess Qty", "Excess Amt Rs.", "Saving Qty",
+            "Saving Amt Rs.", "REMARKS/REASON."
+        ]]
+        for item in deviation_data["items"]:
+            has_unit = bool(item.get("unit", "").strip())
+            has_rate = has_unit and bool(str(item.get("rate", "")).strip())
+            deviation_rows.append([
+                str(item.get("serial_no", "")),
+                item.get("description", ""),
+                item.get("unit", ""),
+                str(item.get("qty_wo", "")) if has_unit else "",
+                str(item.get("rate", "")) if has_unit else "",
+                str(item.get("amt_wo", "")) if has_rate else "",
+                str(item.get("qty_bill", "")) if has_unit else "",
+                str(item.get("amt_bill", "")) if has_rate else "",
+                str(item.get("excess_qty", "")) if has_unit else "",
+                str(item.get("excess_amt", "")) if has_rate else "",
+                str(item.get("saving_qty", "")) if has_unit else "",
+                str(item.get("saving_amt", "")) if has_rate else "",
+                item.get("remark", "")
+            ])
+
+        summary = deviation_data["summary"]
+        premium_percent = summary.get("premium", {}).get("percent", 0) * 100
+        net_diff = summary.get("net_difference", 0)
+        for label, suffix in (
+            ("Grand Total Rs.", None),
+            (f"Add Tender Premium ({premium_percent:.2f}%)", "tender_premium"),
+            ("Grand Total including Tender Premium Rs.", "grand_total")
+        ):
+            keys = (
+                ["work_order_total", "executed_total", "overall_excess", "overall_saving"] if suffix is None
+                else [f"{suffix}_{column}" for column in "fhjl"]
+            )
+            row = [""] * 13
+            row[1] = label
+            for column, key in zip((5, 7, 9, 11), keys):
+                row[column] = str(summary.get(key, ""))
+            deviation_rows.append(row)
+        net_diff_row = [""] * 13
+        net_diff_row[1] = "Overall Excess With Respect to the Work Order Amount Rs." if net_diff > 0 else "Overall Saving With Respect to the Work Order Amount Rs."
+        net_diff_row[7] = str(abs(net_diff))
+        deviation_rows += [net_diff_row, [""] * 13]
+
+        add_word_table(
+            doc,
+            [0.353, 6.352, 0.353, 0.353, 0.353, 0.353, 0.353, 0.353, 0.353, 0.353, 0.353, 0.353, 0.795],
+            deviation_rows,
+            DEVIATION_TABLE_STYLE,
+            autofit=False
+        )
+
+        doc.save(output_path)
+
     except Exception as e:
-        st.error(f"Error generating Word document for {sheet_name if sheet_name else 'Deviation Statement'}: {str(e)}")
-        st.write(traceback.format_exc())
+        notify("error", f"Error generating Word document for {sheet_name if sheet_name else 'Deviation Statement'}: {str(e)}")
+        notify("write", traceback.format_exc())
         raise
 
+# Sheets of the bill package in output order, with their page orientation
+BILL_SHEET_LAYOUT = [
+    ("First Page", "portrait"),
+    ("Last Page", "portrait"),
+    ("Extra Items", "portrait"),
+    ("Deviation Statement", "landscape"),
+    ("Note Sheet", "portrait"),
+    ("Certificate III", "portrait")
+]
+
+FIXED_HEADER = "FOR CONTRACTORS & SUPPLIERS ONLY FOR PAYMENT FOR WORK OR SUPPLIES ACTUALLY MEASURED WORK ORDER"
+
+def build_user_inputs(fields):
+    """
+    Complete the sidebar field values with the fixed bill header and the
+    officer placeholders used by the templates.
+    Args:
+        fields: Dict of sidebar values, dates already formatted as dd-mm-yyyy.
+    """
+    user_inputs = {
+        "fixed_header": FIXED_HEADER,
+        "bill_serial": "First & Final Bill",
+        "start_date": "",
+        "completion_date": "",
+        "actual_completion_date": "",
+        "work_order_amount": 0.0,
+        "premium_percent": 0.0,
+        "premium_type": "Above",
+        "amount_paid_last_bill": 0.0,
+        "cash_voucher_no": "",
+        "cash_voucher_date": "",
+        "contractor_name": "",
+        "work_description": "",
+        "last_bill_no": "Not Applicable",
+        "work_order_ref": "",
+        "agreement_no": "",
+        "written_order_date": "",
+        "is_first_bill": False,
+        "measurement_officer": "Measurement Officer Name",
+        "measurement_date": "30/04/2025",
+        "measurement_book_page": "123",
+        "measurement_book_no": "MB-001",
+        "officer_name": "Officer Name",
+        "officer_designation": "Designation",
+        "authorising_officer_name": "Authorising Officer Name",
+        "authorising_officer_designation": "Designation"
+    }
+    user_inputs.update(fields)
+    return user_inputs
+
+def missing_mandatory_fields(user_inputs):
+    """Names of the mandatory sidebar fields left empty."""
+    mandatory = ["bill_serial", "start_date", "completion_date", "actual_completion_date", "work_order_amount"]
+    return [field for field in mandatory if not user_inputs.get(field)]
+
+def build_sheet_data(data, deviation_data, header_data, user_inputs):
+    """
+    Assemble the template data of every bill sheet from process_bill's output.
+    Returns:
+        Dict of sheet name to the data passed to its template.
+    """
+    totals = deviation_data["summary"]
+    premium_fraction = totals["premium"]["percent"]
+    amount_paid_last_bill = float(user_inputs["amount_paid_last_bill"])
+    work_order_amount = float(user_inputs["work_order_amount"])
+
+    extra_total = totals["extra_items_total"]
+    grand_total = totals["executed_total"]
+    payable = totals["grand_total_h"]
+    balance = round(payable - amount_paid_last_bill, 2)
+
+    first_page = {
+        "header": [
+            ["1", "Name of Contractor or supplier", user_inputs["contractor_name"]],
+            ["2", "Name of Work", user_inputs["work_description"]],
+            ["3", "Serial No. of this bill", user_inputs["bill_serial"]],
+            ["4", "No. and date of the last bill", user_inputs["last_bill_no"]],
+            ["5", "Reference to work order or Agreement", user_inputs["work_order_ref"]],
+            ["6", "Agreement No.", user_inputs["agreement_no"]],
+            ["7", "Date of written order to commence work", user_inputs["written_order_date"]],
+            ["8", "St. date of Start", user_inputs["start_date"]],
+            ["9", "St. date of completion", user_inputs["completion_date"]],
+            ["10", "Date of actual completion of work", user_inputs["actual_completion_date"]],
+            ["11", "Cash Book Voucher No. and Date", f"{user_inputs['cash_voucher_no']} {user_inputs['cash_voucher_date']}".strip()]
+        ],
+        "items": data["items"],
+        "totals": {
+            "grand_total": grand_total,
+            "premium": {"percent": premium_fraction, "type": totals["premium"]["type"], "amount": totals["tender_premium_h"]},
+            "payable": payable
+        },
+        "premium_percent": premium_fraction,
+        "amount_paid_last_bill": amount_paid_last_bill
+    }
+
+    note_sheet = generate_bill_notes(totals, work_order_amount)
+    note_sheet.update({
+        "agreement_no": user_inputs["agreement_no"],
+        "name_of_work": user_inputs["work_description"],
+        "name_of_firm": user_inputs["contractor_name"],
+        "date_commencement": user_inputs["start_date"],
+        "date_completion": user_inputs["completion_date"],
+        "actual_completion": user_inputs["actual_completion_date"],
+        "extra_item_amount": extra_total
+    })
+
+    return {
+        "First Page": first_page,
+        "Last Page": {
+            "payable_amount": payable,
+            "amount_words": number_to_words(round(payable)),
+            "notes": [
+                f"Net amount payable: Rs. {payable}",
+                f"(Rupees {number_to_words(round(payable))} only)"
+            ]
+        },
+        "Extra Items": {
+            "items": data["extra_items"],
+            "name_of_work": user_inputs["work_description"],
+            "bill_serial": user_inputs["bill_serial"],
+            "name_of_firm": user_inputs["contractor_name"],
+            "totals": {
+                "grand_total": extra_total,
+                "premium": {"percent": premium_fraction, "amount": totals["extra_items_premium"]},
+                "payable": totals["extra_items_payable"]
+            }
+        },
+        "Deviation Statement": {**deviation_data, "header": header_data["deviation_headers"]},
+        "Note Sheet": note_sheet,
+        "Certificate III": {
+            "payable_amount": payable,
+            "total_123": payable,
+            "balance_4_minus_5": balance,
+            "amount_paid_last_bill": amount_paid_last_bill,
+            "payment_now": balance,
+            "by_cheque": balance,
+            "cheque_amount_words": number_to_words(round(balance)),
+            "certificate_items": [],
+            "total_recovery": 0,
+            "totals": {
+                "grand_total": grand_total,
+                "payable_amount": payable,
+                "extra_items_sum": extra_total,
+                "total_123": payable
+            }
+        }
+    }
+
+# What each bill output is built from: user_inputs fields, the uploaded
+# "workbook", the agreement's "previous_bill" in the running-account store,
+# and other outputs. "items" is process_bill's output: the item tables and
+# the bill's totals.
+BILL_DEPENDENCIES = {
+    "items": ("workbook", "previous_bill", "premium_percent", "premium_type", "work_name", "contractor_name", "agreement_no"),
+    "First Page": (
+        "items", "amount_paid_last_bill", "contractor_name", "work_description", "bill_serial", "last_bill_no",
+        "work_order_ref", "agreement_no", "written_order_date", "start_date", "completion_date",
+        "actual_completion_date", "cash_voucher_no", "cash_voucher_date"
+    ),
+    "Last Page": ("items",),
+    "Extra Items": ("items", "work_description", "bill_serial", "contractor_name"),
+    "Deviation Statement": ("items",),
+    "Note Sheet": (
+        "items", "work_order_amount", "agreement_no", "work_description", "contractor_name", "start_date",
+        "completion_date", "actual_completion_date"
+    ),
+    "Certificate III": ("items", "amount_paid_last_bill"),
+    "word_doc": ("items",)
+}
+
+def combined_key(*values):
+    """Digest of a sequence of JSON-serialisable values."""
+    return hashlib.sha256(json.dumps(values, default=str).encode("utf-8")).hexdigest()
+
+def bill_input_keys(user_inputs, sources):
+    """
+    Key every output of BILL_DEPENDENCIES by the values of its inputs: equal
+    keys mean the output would be built the same.
+    Args:
+        sources: Keys of the "workbook" and "previous_bill" inputs.
+    Returns:
+        Dict of output name to key.
+    """
+    keys = dict(sources)
+
+    def key(name):
+        if name not in keys:
+            if name in BILL_DEPENDENCIES:
+                keys[name] = combined_key(*[(dependency, key(dependency)) for dependency in BILL_DEPENDENCIES[name]])
+            else:
+                keys[name] = combined_key(user_inputs.get(name))
+        return keys[name]
+
+    for name in BILL_DEPENDENCIES:
+        key(name)
+    return keys
+
+class BillRun:
+    """
+    Outputs of a session's last bill, each kept under the key of the inputs
+    it was built from (bill_input_keys). The session's next bill reuses every
+    output whose key has not changed and rebuilds only the others. Held in
+    the session state and updated by the session's jobs, one at a time.
+    """
+
+    def __init__(self):
+        self._outputs = {}
+
+    def get(self, name, key):
+        """The output built from inputs with `key`, or None when it is stale."""
+        stored_key, output = self._outputs.get(name, (None, None))
+        return output if stored_key == key else None
+
+    def put(self, name, key, output):
+        self._outputs[name] = (key, output)
+        return output
+
+def generate_bill_package(ingested, user_inputs, render_mode=RENDER_MODE, run=None, workbook_key=None):
+    """
+    Run the bill pipeline for an ingested workbook: process_bill, PDF
+    rendering and merging, the Word document and the zip. Everything stays
+    in memory; nothing is left on disk except the bill's entry in the
+    running-account store, when the agreement number is given. Unless it is
+    a first bill, quantities since the last certificate and an amount paid
+    left at zero come from the agreement's previous bill in the store.
+    Args:
+        ingested: Output of ingest_workbook.
+        user_inputs: Output of build_user_inputs.
+        render_mode: "per_sheet", "batched" or "chunked".
+        run: BillRun of the session's previous bill, with `workbook_key`.
+            Outputs whose inputs are unchanged since that bill are taken
+            from it instead of being rebuilt, and it is updated with this
+            bill's outputs.
+        workbook_key: Content hash of the workbook `ingested` was read from.
+    Returns:
+        The output zip as bytes.
+    """
+    store = running_account_store()
+    agreement_no = str(user_inputs["agreement_no"]).strip()
+    previous = None
+    if store is not None and agreement_no and not user_inputs["is_first_bill"]:
+        with timed("previous_bill"):
+            previous = store.previous_bill(agreement_no, user_inputs["bill_serial"])
+    if previous is not None:
+        if not user_inputs["amount_paid_last_bill"]:
+            user_inputs = {**user_inputs, "amount_paid_last_bill": previous["payable"]}
+        log_event("previous_bill", agreement_no=agreement_no, bill_serial=previous["bill_serial"],
+                  items=len(previous["items"]), payable=previous["payable"])
+        notify("info", f"Quantities since the last certificate are taken against bill {previous['bill_serial']} "
+                f"of agreement {agreement_no}; amount paid vide last bill: Rs. {user_inputs['amount_paid_last_bill']}")
+
+    if run is None or workbook_key is None:
+        # Nothing to reuse: every output is built
+        run, workbook_key = BillRun(), ""
+    keys = bill_input_keys(user_inputs, {
+        "workbook": workbook_key,
+        "previous_bill": combined_key(previous and [previous["payable"], sorted(previous["items"].items())])
+    })
+    reused = []
+
+    processed = run.get("items", keys["items"])
+    if processed is None:
+        with timed("process_bill"):
+            data, deviation_data, header_data = process_bill(
+                None,
+                None,
+                None,
+                user_inputs["premium_percent"],
+                user_inputs["premium_type"],
+                user_inputs["amount_paid_last_bill"],
+                user_inputs["is_first_bill"],
+                user_inputs,
+                ingested=ingested,
+                previous_items=previous["items"] if previous else None
+            )
+        processed = run.put("items", keys["items"], (data, deviation_data, header_data))
+    else:
+        reused.append("items")
+    data, deviation_data, header_data = processed
+    notify_issues(data["validation"])
+    with timed("sheet_data"):
+        sheet_data = build_sheet_data(data, deviation_data, header_data, user_inputs)
+
+    render_jobs = [
+        (sheet_name, sheet_data[sheet_name], orientation, None)
+        for sheet_name, orientation in BILL_SHEET_LAYOUT
+    ]
+    parts = render_parts(render_jobs, render_mode)
+    part_names = [" + ".join(job[0] for job in part) for part in parts]
+    part_keys = [combined_key(render_mode, *[keys[job[0]] for job in part]) for part in parts]
+    pdf_key = combined_key(PDF_OPTIMIZE, *part_keys)
+    merged_pdf = run.get("merged_pdf", pdf_key)
+    if merged_pdf is None:
+        pdf_files = [run.get(name, key) for name, key in zip(part_names, part_keys)]
+        stale = [index for index, pdf in enumerate(pdf_files) if pdf is None]
+        reused.extend(part_names[index] for index in range(len(parts)) if index not in stale)
+        with timed("render_pdfs", mode=render_mode, parts=len(stale)):
+            for index, pdf in zip(stale, render_pdfs([parts[index] for index in stale], render_mode)):
+                pdf_files[index] = run.put(part_names[index], part_keys[index], pdf)
+        with timed("merge_pdfs"):
+            merged_pdf = merge_pdfs(pdf_files)
+        if PDF_OPTIMIZE:
+            with timed("optimize_pdf") as span:
+                merged_pdf, span["bytes_before"], span["bytes_after"] = optimize_pdf(merged_pdf)
+        run.put("merged_pdf", pdf_key, merged_pdf)
+    else:
+        reused.append("merged_pdf")
+
+    doc_bytes = run.get("word_doc", keys["word_doc"])
+    if doc_bytes is None:
+        with timed("word_doc"):
+            doc_buffer = io.BytesIO()
+            create_word_doc(data, deviation_data, header_data, output_path=doc_buffer)
+            doc_bytes = run.put("word_doc", keys["word_doc"], doc_buffer.getvalue())
+    else:
+        reused.append("word_doc")
+    if reused:
+        log_event("bill_outputs_reused", outputs=reused)
+
+    with timed("zip"):
+        current_date = datetime.now().strftime("%Y%m%d")
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+            zipf.writestr(f"BILL_AND_DEVIATION_{current_date}.pdf", merged_pdf)
+            zipf.writestr(f"BILL_AND_DEVIATION_{current_date}.docx", doc_bytes)
+
+    # Recorded once the package is built, so a failed run leaves no bill behind
+    if store is not None and agreement_no:
+        with timed("record_bill"):
+            store.record_bill(agreement_no, user_inputs["bill_serial"], data["items"],
+                              sheet_data["First Page"]["totals"]["payable"])
+    return zip_buffer.getvalue()
+
+# Bills generated at once by the background job queue, across all sessions
+JOB_WORKERS = int(os.environ.get("BILL_JOB_WORKERS", "2"))
+# Minutes a finished bill stays available for download
+JOB_RETENTION_MINUTES = float(os.environ.get("BILL_JOB_RETENTION_MINUTES", "30"))
+# Seconds between page refreshes while the session's bill is queued or running
+JOB_POLL_SECONDS = 0.5
+
+# Pipeline stages shown as job progress: (stage, label, progress at its start)
+BILL_STAGES = [
+    ("ingest", "Reading the workbook", 0.0),
+    ("previous_bill", "Looking up the previous bill", 0.04),
+    ("process_bill", "Processing items", 0.05),
+    ("sheet_data", "Preparing the sheets", 0.08),
+    ("render_pdfs", "Rendering PDFs", 0.1),
+    ("merge_pdfs", "Merging PDFs", 0.7),
+    ("optimize_pdf", "Optimizing the PDF", 0.75),
+    ("word_doc", "Writing the Word document", 0.8),
+    ("zip", "Packing the zip", 0.95),
+    ("record_bill", "Recording the bill", 0.98)
+]
+STAGE_PROGRESS = {
+    stage: (label, start, next_start)
+    for (stage, label, start), (_, _, next_start) in zip(BILL_STAGES, BILL_STAGES[1:] + [(None, None, 1.0)])
+}
+
+class BillJob:
+    """
+    One bill submitted to the job queue: its stage and progress while it
+    runs, then the output zip or the error, with the messages, validation
+    report and timings of the run. Written by the worker thread, read by the
+    session's reruns.
+    """
+
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.status = "queued"
+        self.stage = "Waiting for a free worker"
+        self.progress = 0.0
+        self.messages = []
+        self.report = None
+        self.result = None
+        self.error = None
+        # Exception class of a failed job, so callers can tell a rejected workbook from a fault
+        self.error_type = None
+        self.timings = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._stage_range = (0.0, 0.0)
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def enter_stage(self, stage):
+        if stage in STAGE_PROGRESS:
+            self.stage, start, end = STAGE_PROGRESS[stage]
+            self._stage_range = (start, end)
+            self.progress = start
+
+    def outside_messages(self):
+        """
+        The job's messages for a caller without a page (the CLI, the HTTP
+        service): all but the "write" ones, the tracebacks, which are logged
+        instead.
+        """
+        messages = []
+        for level, message in self.messages:
+            if level == "write":
+                log_event("bill_job_detail", level=logging.WARNING, job=self.id, label=self.label, detail=message)
+            else:
+                messages.append(message)
+        return messages
+
+    def stage_step(self, done, total):
+        """Advance within the current stage: `done` of its `total` parts are finished."""
+        start, end = self._stage_range
+        self.progress = start + (end - start) * done / total
+        self.stage = f"{self.stage.split(':')[0]}: {done} of {total} done"
+
+    def run(self, func, *args):
+        """Run func(*args) as this job, in a queue worker thread."""
+        token = CURRENT_JOB.set(self)
+        self.status = "running"
+        try:
+            with instrumented_run(self.label) as timings:
+                self.timings = timings
+                self.result = func(*args)
+            self.status, self.stage, self.progress = "done", "Done", 1.0
+        except Exception as e:
+            self.status, self.error, self.error_type = "failed", str(e), type(e)
+            log_event("bill_job_failed", level=logging.ERROR, job=self.id, label=self.label,
+                      error=traceback.format_exc())
+        finally:
+            self.finished_at = time.time()
+            CURRENT_JOB.reset(token)
+
+class BillJobQueue:
+    """
+    Queue of bill jobs shared by every session of the process. A fixed pool
+    of JOB_WORKERS takes jobs in submission order, so concurrent users share
+    a bounded throughput instead of each starting a pipeline and its
+    converters at once. Finished jobs are held for download for
+    JOB_RETENTION_MINUTES.
+    """
+
+    def __init__(self, workers):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bill-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, label, func, *args):
+        job = BillJob(label)
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        self._pool.submit(job.run, func, *args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        """Number of queued jobs submitted before `job`."""
+        with self._lock:
+            return sum(1 for other in self._jobs.values()
+                       if other.status == "queued" and other.submitted_at < job.submitted_at)
+
+    def _evict(self):
+        cutoff = time.time() - JOB_RETENTION_MINUTES * 60
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+@process_resource
+def bill_job_queue():
+    """The process-wide BillJobQueue."""
+    return BillJobQueue(JOB_WORKERS)
+
+def run_bill_job(file_bytes, user_inputs, run=None, ingested=None):
+    """
+    Ingest an uploaded workbook and generate its bill package, reusing the
+    unchanged outputs of the session's BillRun; the body of a queued job.
+    Args:
+        ingested: The upload's entry in ingested_workbooks(), when it was
+            found before the job was submitted.
+    """
+    upload_hash = hashlib.sha256(file_bytes).hexdigest()
+    if ingested is None:
+        with timed("ingest"):
+            ingested = load_workbook_items(upload_hash, str(user_inputs["agreement_no"]).strip(), file_bytes)
+    return generate_bill_package(ingested, user_inputs, run=run, workbook_key=upload_hash)
+
+def show_bill_job(job):
+    """
+    Show the session's bill job: its queue position or stage while it runs,
+    refreshing the page until it ends, then its messages and the download or
+    the error.
+    """
+    if job is None:
+        return
+    if job.active:
+        if job.status == "queued":
+            ahead = bill_job_queue().position(job)
+            st.progress(0.0, text=f"{job.label}: queued, {ahead} bill(s) ahead" if ahead else f"{job.label}: queued")
+        else:
+            st.progress(min(job.progress, 1.0), text=f"{job.label}: {job.stage}")
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
+    for level, message in job.messages:
+        getattr(st, level)(message)
+    show_validation_report(job.report, key=f"validation_{job.id}")
+    if job.status == "failed":
+        st.error(f"Error processing file: {job.error}")
+        return
+    st.download_button(
+        label="Download Output Files",
+        data=job.result,
+        file_name="bill_output.zip",
+        mime="application/zip"
+    )
+    show_timings(job.timings)
+
 def main():
     st.markdown("""
     <style>
@@ -584,7 +2679,6 @@ def main():
 
     uploaded_file = st.file_uploader("Upload Excel File", type=["xlsx", "xls"])
 
-    fixed_header = "FOR CONTRACTORS & SUPPLIERS ONLY FOR PAYMENT FOR WORK OR SUPPLIES ACTUALLY MEASURED WORK ORDER"
     bill_serial = st.sidebar.text_input("Serial No. of this bill", "First & Final Bill")
     start_date = st.sidebar.date_input("St. date of Start")
     completion_date = st.sidebar.date_input("St. date of completion")
@@ -592,7 +2686,10 @@ def main():
     work_order_amount = st.sidebar.number_input("WORK ORDER AMOUNT RS.", min_value=0.0)
     premium_type = st.sidebar.selectbox("Premium Type", ["Above", "Below"])
     premium_percent = st.sidebar.number_input("Premium Percentage", min_value=0.0, max_value=100.0, value=0.0, step=0.1)
-    amount_paid_last_bill = st.sidebar.number_input("Amount Paid vide Last bill", min_value=0.0)
+    amount_paid_last_bill = st.sidebar.number_input(
+        "Amount Paid vide Last bill", min_value=0.0,
+        help="Left at 0, the payable amount of the agreement's previous bill is used when one is on record"
+    )
     cash_voucher_no = st.sidebar.text_input("Cash Book Voucher No.", "")
     cash_voucher_date = st.sidebar.date_input("Cash Book Voucher Date", value=None)
     contractor_name = st.sidebar.text_input("Name of Contractor or supplier", "")
@@ -603,103 +2700,46 @@ def main():
     written_order_date = st.sidebar.date_input("Date of written order to commence work", value=None)
     is_first_bill = st.sidebar.checkbox("Is First Bill")
 
+    queue = bill_job_queue()
     if st.button("Generate Bill"):
         if uploaded_file is not None:
-            try:
-                if not all([bill_serial, start_date, completion_date, actual_completion_date, work_order_amount]):
-                    st.error("Please fill all mandatory fields")
-                    return
-
-                with pd.ExcelFile(uploaded_file) as xls:
-                    ws_wo = pd.read_excel(xls, "Work Order", header=None)
-                    ws_bq = pd.read_excel(xls, "Bill Quantity", header=None)
-                    ws_extra = pd.read_excel(xls, "Extra Items", header=None)
-
-                first_page_data, last_page_data, deviation_data, extra_items_data, note_sheet_data, certificate_iii_data = process_bill(
-                    ws_wo,
-                    ws_bq,
-                    ws_extra,
-                    premium_percent,
-                    premium_type,
-                    amount_paid_last_bill,
-                    is_first_bill,
-                    user_inputs={
-                        "fixed_header": fixed_header,
-                        "bill_serial": bill_serial,
-                        "start_date": start_date.strftime("%d-%m-%Y") if start_date else "",
-                        "completion_date": completion_date.strftime("%d-%m-%Y") if completion_date else "",
-                        "actual_completion_date": actual_completion_date.strftime("%d-%m-%Y") if actual_completion_date else "",
-                        "work_order_amount": work_order_amount,
-                        "premium_percent": premium_percent,
-                        "premium_type": premium_type,
-                        "amount_paid_last_bill": amount_paid_last_bill,
-                        "cash_voucher_no": cash_voucher_no,
-                        "cash_voucher_date": cash_voucher_date.strftime("%d-%m-%Y") if cash_voucher_date else "",
-                        "contractor_name": contractor_name,
-                        "work_description": work_description,
-                        "last_bill_no": last_bill_no,
-                        "work_order_ref": work_order_ref,
-                        "agreement_no": agreement_no,
-                        "written_order_date": written_order_date.strftime("%d-%m-%Y") if written_order_date else "",
-                        "is_first_bill": is_first_bill,
-                        "measurement_officer": "Measurement Officer Name",
-                        "measurement_date": "30/04/2025",
-                        "measurement_book_page": "123",
-                        "measurement_book_no": "MB-001",
-                        "officer_name": "Officer Name",
-                        "officer_designation": "Designation",
-                        "authorising_officer_name": "Authorising Officer Name",
-                        "authorising_officer_designation": "Designation"
-                    }
-                )
+            if not all([bill_serial, start_date, completion_date, actual_completion_date, work_order_amount]):
+                st.error("Please fill all mandatory fields")
+                return
 
-                pdf_files = []
-                for sheet_name, data, orientation, template_name in [
-                    ("First Page", first_page_data, "portrait", "first_page"),
-                    ("Last Page", last_page_data, "portrait", "last_page"),
-                    ("Extra Items", extra_items_data, "portrait", "extra_items"),
-                    ("Deviation Statement", deviation_data, "landscape", "deviation_statement"),
-                    ("Note Sheet", note_sheet_data, "portrait", "note_sheet"),
-                    ("Certificate III", certificate_iii_data, "portrait", "certificate_iii")
-                ]:
-                    pdf_path = os.path.join(TEMP_DIR, f"{sheet_name.replace(' ', '_')}.pdf")
-                    if generate_pdf(template_name, data, orientation, pdf_path):
-                        pdf_files.append(pdf_path)
-
-                current_date = datetime.now().strftime("%Y%m%d")
-                pdf_output = os.path.join(TEMP_DIR, f"BILL_AND_DEVIATION_{current_date}.pdf")
-                merge_pdfs(pdf_files, pdf_output)
-
-                word_files = []
-                for sheet_name, data in [
-                    ("First Page", first_page_data),
-                    ("Last Page", last_page_data),
-                    ("Extra Items", extra_items_data),
-                    ("Deviation Statement", deviation_data),
-                    ("Note Sheet", note_sheet_data),
-                    ("Certificate III", certificate_iii_data)
-                ]:
-                    doc_path = os.path.join(TEMP_DIR, f"{sheet_name.replace(' ', '_')}.docx")
-                    if create_word_doc(sheet_name, data, doc_path, "landscape" if sheet_name == "Deviation Statement" else "portrait"):
-                        word_files.append(doc_path)
-
-                zip_path = os.path.join(TEMP_DIR, "output.zip")
-                with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-                    zipf.write(pdf_output, os.path.basename(pdf_output))
-                    for word_file in word_files:
-                        zipf.write(word_file, os.path.basename(word_file))
-
-                with open(zip_path, "rb") as f:
-                    bytes_data = f.read()
-                st.download_button(
-                    label="Download Output Files",
-                    data=bytes_data,
-                    file_name="bill_output.zip",
-                    mime="application/zip"
+            current = queue.get(st.session_state.get("bill_job_id"))
+            if current is not None and current.active:
+                st.info("A bill from this session is still being generated; it is shown below.")
+            else:
+                user_inputs = build_user_inputs({
+                    "bill_serial": bill_serial,
+                    "start_date": start_date.strftime("%d-%m-%Y") if start_date else "",
+                    "completion_date": completion_date.strftime("%d-%m-%Y") if completion_date else "",
+                    "actual_completion_date": actual_completion_date.strftime("%d-%m-%Y") if actual_completion_date else "",
+                    "work_order_amount": work_order_amount,
+                    "premium_percent": premium_percent,
+                    "premium_type": premium_type,
+                    "amount_paid_last_bill": amount_paid_last_bill,
+                    "cash_voucher_no": cash_voucher_no,
+                    "cash_voucher_date": cash_voucher_date.strftime("%d-%m-%Y") if cash_voucher_date else "",
+                    "contractor_name": contractor_name,
+                    "work_description": work_description,
+                    "last_bill_no": last_bill_no,
+                    "work_order_ref": work_order_ref,
+                    "agreement_no": agreement_no,
+                    "written_order_date": written_order_date.strftime("%d-%m-%Y") if written_order_date else "",
+                    "is_first_bill": is_first_bill
+                })
+                # Outputs of the session's last bill that the new one can reuse
+                run = st.session_state.setdefault("bill_run", BillRun())
+                file_bytes = uploaded_file.getvalue()
+                ingested = ingested_workbooks().get(
+                    (hashlib.sha256(file_bytes).hexdigest(), str(user_inputs["agreement_no"]).strip())
                 )
-            except Exception as e:
-                st.error(f"Error processing file: {str(e)}")
-                st.stop()
+                job = queue.submit(uploaded_file.name, run_bill_job, file_bytes, user_inputs, run, ingested)
+                st.session_state["bill_job_id"] = job.id
+
+    show_bill_job(queue.get(st.session_state.get("bill_job_id")))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
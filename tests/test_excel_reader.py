@@ -0,0 +1,65 @@
+"""The streaming reader gives the items pandas.read_excel gave."""
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from streamlit_app import BILL_SHEETS, ITEM_START_ROW, ingest_workbook, read_bill_sheets
+
+def engines():
+    """The Excel engines installed: openpyxl, and calamine with python-calamine."""
+    found = ["openpyxl"]
+    try:
+        import python_calamine  # noqa: F401
+        found.append("calamine")
+    except ImportError:
+        pass
+    return found
+
+
+def write_workbook(path, item_rows, extra_rows=(), notes_row=None):
+    """Bill workbook with `item_rows` on both item sheets from ITEM_START_ROW and no column titles."""
+    wb = Workbook()
+    wb.remove(wb.active)
+    for sheet_name in ("Work Order", "Bill Quantity"):
+        ws = wb.create_sheet(sheet_name)
+        for offset, row in enumerate(item_rows):
+            for column, value in enumerate(row, 1):
+                ws.cell(ITEM_START_ROW + offset + 1, column, value)
+        if notes_row is not None:
+            # Past column G and below the items: read_excel still counts the rows
+            ws.cell(notes_row, 9, "checked")
+    ws = wb.create_sheet("Extra Items")
+    for offset, row in enumerate(extra_rows):
+        for column, value in enumerate(row, 1):
+            ws.cell(offset + 1, column, value)
+    wb.save(path)
+    return path
+
+
+def pandas_items(path):
+    with pd.ExcelFile(path) as xls:
+        return ingest_workbook(*(pd.read_excel(xls, sheet_name, header=None) for sheet_name in BILL_SHEETS))
+
+
+@pytest.mark.parametrize("engine", engines())
+def test_numeric_column_with_blank_is_float_text(tmp_path, engine):
+    path = write_workbook(tmp_path / "bill.xlsx", [
+        [1, "Wiring", "Each", 10, 5.5, 55, 101],
+        [None, "Sub item", "Each", 2, 3, 6, None],
+        [3, "Fan", "Each", 4, 2, 8, 103]
+    ])
+    items = ingest_workbook(*read_bill_sheets(str(path), engine))
+    assert [item["serial_no"] for item in items["wo_items"]] == ["1.0", "", "3.0"]
+    assert [item["bsr"] for item in items["bill_items"]] == ["101.0", "", "103.0"]
+    assert repr(items) == repr(pandas_items(path))
+
+
+@pytest.mark.parametrize("engine", engines())
+def test_column_types_match_read_excel(tmp_path, engine):
+    path = write_workbook(tmp_path / "bill.xlsx", [
+        [1, "Wiring", "Each", 10, 5, 50, "1.5.1"],
+        [2, "Points", "Mtr.", 3, 2.5, 7.5, 102],
+        ["3", "Text serial", "Each", "4", 2, 8, "103"],
+        [4, "N/A", "NA", 1, 1, 1, 104]
+    ], extra_rows=[["E-1", None, "Extra", 2, "Each", 10, 20], [2, None, "More", 1, "Each", 5, 5]], notes_row=40)
+    assert repr(ingest_workbook(*read_bill_sheets(str(path), engine))) == repr(pandas_items(path))
@@ -0,0 +1,51 @@
+"""The First Page shows the quantities and amounts since the previous bill."""
+import io
+import os
+import re
+
+import pytest
+
+from streamlit_app import build_sheet_data, build_user_inputs, ingest_bill_workbook, process_bill, render_sheet_html
+
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_files",
+                        "SAMPLE BILL INPUT- NO EXTRA ITEMS.xlsx")
+
+
+def second_bill_first_page():
+    """First Page data of a running bill whose first billed item had half its quantity on the previous bill."""
+    user_inputs = build_user_inputs({"work_order_amount": 854678.0, "premium_percent": 5.0, "agreement_no": "AG1"})
+    ingested = ingest_bill_workbook(WORKBOOK)
+    item = next(item for item in ingested["bill_items"] if item["bsr"] and item["qty_bill"] > 0)
+    previous_items = {item["bsr"]: (item["qty_bill"] / 2, item["amount"] / 2)}
+    data, deviation_data, header_data = process_bill(
+        None, None, None, 5.0, "Above", 0.0, False, user_inputs, ingested, previous_items
+    )
+    row = next(row for row in data["items"] if row["bsr"] == item["bsr"])
+    return build_sheet_data(data, deviation_data, header_data, user_inputs)["First Page"], row
+
+
+def test_template_shows_since_last_quantity():
+    first_page, row = second_bill_first_page()
+    assert row["qty_since_last"] == row["qty_upto_date"] / 2 != 0
+
+    html = render_sheet_html("First Page", first_page)
+    rows = re.findall(r"<tr>\s*(.*?)\s*</tr>", html, re.S)
+    cells = next(
+        re.findall(r"<td[^>]*>(.*?)</td>", cells_html, re.S) for cells_html in rows
+        if f">{row['description']}</td>" in cells_html
+    )
+    assert cells[1] == str(row["qty_since_last"])
+    assert cells[2] == str(row["qty_upto_date"])
+    assert cells[6] == str(row["amount_upto_date"])
+    assert cells[7] == str(row["amount_since_prev"])
+
+
+def test_direct_backend_shows_since_last_quantity():
+    pytest.importorskip("fpdf")
+    from pypdf import PdfReader
+
+    from pdf_direct import draw_sheet
+    first_page, row = second_bill_first_page()
+    text = "".join(page.extract_text() for page in PdfReader(io.BytesIO(draw_sheet("First Page", first_page, "portrait"))).pages)
+    assert str(row["qty_since_last"]) in text
+    assert str(row["amount_since_prev"]) in text
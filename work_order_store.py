@@ -0,0 +1,117 @@
+"""
+Work-order store: the cleaned Work Order items of each agreement.
+
+A work order barely changes from one bill of an agreement to the next, so the
+Work Order items ingested for a bill are kept as an Arrow IPC file under the
+agreement number and a fingerprint of the Work Order sheet. A later bill whose
+sheet has the same fingerprint memory-maps that file instead of reading and
+cleaning the sheet again; its number columns are used in place as read-only
+arrays, and only the text becomes Python strings.
+
+Entries not used for `max_age_days` are deleted, then the least recently used
+ones until the store fits in `max_bytes`. Needs the optional pyarrow package;
+the streamlit_app.py pipeline uses the store when BILL_WORK_ORDER_DIR is not
+empty and pyarrow is installed.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pyarrow as pa
+
+# Bumped whenever the cleaning of Work Order rows changes, so items stored by
+# an earlier version are not reused
+FORMAT_VERSION = "2"
+
+SCHEMA = pa.schema([
+    ("serial_no", pa.string()),
+    ("description", pa.string()),
+    ("unit", pa.string()),
+    ("qty_wo", pa.float64()),
+    ("rate", pa.float64()),
+    ("amount", pa.float64()),
+    ("bsr", pa.string()),
+    ("row", pa.int64())
+])
+
+
+class WorkOrderStore:
+    """
+    Directory of Arrow files, one per agreement and Work Order sheet. Files
+    are written atomically, so the app's session threads and the CLI's worker
+    processes can share a store.
+    """
+
+    def __init__(self, directory, max_bytes, max_age_days):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, agreement_no, fingerprint):
+        key = hashlib.sha256(f"{FORMAT_VERSION}\0{agreement_no}\0{fingerprint}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.arrow")
+
+    def get(self, agreement_no, fingerprint):
+        """
+        The Work Order items stored for the agreement's sheet.
+        Returns:
+            (columns, issues): {name: values} of the SCHEMA columns, numbers
+            as read-only arrays over the mapped file and text as lists, and
+            the sheet's invalid_cells report. None on a miss.
+        """
+        path = self._path(agreement_no, fingerprint)
+        try:
+            # The arrays keep the mapping alive after the file object is gone
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        columns = {
+            field.name: table.column(field.name).to_pylist() if field.type == pa.string()
+            else table.column(field.name).to_numpy()
+            for field in SCHEMA
+        }
+        issues = json.loads(table.schema.metadata[b"issues"])
+        return columns, issues
+
+    def put(self, agreement_no, fingerprint, columns, issues):
+        """
+        Store the Work Order items ingested for the agreement's sheet.
+        Args:
+            columns: {name: values} holding the SCHEMA columns.
+            issues: The sheet's invalid_cells report; values that are not
+                JSON types are kept as text.
+        """
+        table = pa.table({name: columns[name] for name in SCHEMA.names}, schema=SCHEMA).replace_schema_metadata({
+            "agreement_no": agreement_no,
+            "issues": json.dumps(issues, default=str)
+        })
+        fd, partial_path = tempfile.mkstemp(dir=self.directory, suffix=".partial")
+        with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(partial_path, self._path(agreement_no, fingerprint))
+        self.evict()
+
+    def evict(self):
+        """Delete entries unused for max_age_days, then the least recently used past max_bytes."""
+        cutoff = time.time() - self.max_age_days * 86400
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".arrow"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in sorted(entries):
+                if mtime >= cutoff and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size